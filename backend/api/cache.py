@@ -0,0 +1,49 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import caches
+
+from recipes.versions import get_version_tag
+
+
+class ResponseCache:
+    """Кеш готовых ответов справочников.
+
+    Ключ содержит версию таблицы, поэтому изменение записей (сигналы
+    post_save/post_delete повышают версию) делает старые ответы
+    недоступными. Счётчики попаданий и промахов хранятся в том же кеше
+    и общие для всех процессов, если кеш общий.
+    """
+    stats_keys = ('hits', 'misses')
+
+    @property
+    def cache(self):
+        return caches[settings.RESPONSE_CACHE_ALIAS]
+
+    def get_key(self, model, prefix, path):
+        version = get_version_tag(model)
+        path = md5(path.encode()).hexdigest()
+        return f'response:{prefix}:{version}:{path}'
+
+    def get(self, key):
+        content = self.cache.get(key)
+        self.count('misses' if content is None else 'hits')
+        return content
+
+    def set(self, key, content):
+        self.cache.set(key, content, settings.RESPONSE_CACHE_TIMEOUT)
+
+    def count(self, name):
+        key = f'response-cache:{name}'
+        self.cache.add(key, 0, None)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, 1, None)
+
+    def stats(self):
+        return {name: self.cache.get(f'response-cache:{name}', 0)
+                for name in self.stats_keys}
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,130 @@
+import base64
+import binascii
+import uuid
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+EXTENSIONS = {'jpeg': 'jpg', 'png': 'png', 'gif': 'gif', 'webp': 'webp'}
+
+HEADER_SIZE = 16
+
+
+def detect_format(header):
+    """Формат изображения по первым байтам файла или None."""
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    for signature, image_format in SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    return None
+
+
+class StreamingImageField(serializers.ImageField):
+    """Изображение в виде data URI base64 или файла multipart-запроса.
+
+    Base64 декодируется частями во временный файл, который хранится в
+    памяти до IMAGE_UPLOAD_SPOOL_SIZE байт. Размер проверяется до
+    декодирования, формат — по первым байтам, число пикселей — по
+    заголовку изображения, без декодирования растра.
+    """
+    default_error_messages = {
+        'invalid_data': 'Передайте изображение в виде data URI base64.',
+        'max_bytes': ('Размер изображения не должен превышать '
+                      '{max_bytes} байт.'),
+        'max_pixels': ('Изображение не должно содержать больше '
+                       '{max_pixels} пикселей.'),
+        'invalid_format': 'Допустимые форматы изображения: {formats}.',
+        'invalid_image': 'Файл повреждён или не является изображением.',
+    }
+    chunk_size = 64 * 1024
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and data.startswith('http'):
+            # При изменении рецепта клиент возвращает адрес текущего
+            # изображения: оно остаётся прежним. При создании адрес —
+            # не изображение.
+            if self.parent.instance is None and not self.root.partial:
+                self.fail('invalid_data')
+            raise SkipField()
+        if isinstance(data, str):
+            data = self.decode(data)
+        elif getattr(data, 'size', 0) > settings.IMAGE_UPLOAD_MAX_BYTES:
+            self.fail('max_bytes', max_bytes=settings.IMAGE_UPLOAD_MAX_BYTES)
+        file = serializers.FileField.to_internal_value(self, data)
+        self.check_image(file)
+        return file
+
+    def decode(self, data):
+        header, separator, payload = data.partition(';base64,')
+        if not separator or not header.startswith('data:'):
+            self.fail('invalid_data')
+        if len(payload) // 4 * 3 > settings.IMAGE_UPLOAD_MAX_BYTES + 3:
+            self.fail('max_bytes', max_bytes=settings.IMAGE_UPLOAD_MAX_BYTES)
+        file = SpooledTemporaryFile(max_size=settings.IMAGE_UPLOAD_SPOOL_SIZE)
+        try:
+            size, image_format = self.write_payload(payload, file)
+        except binascii.Error:
+            file.close()
+            self.fail('invalid_data')
+        except serializers.ValidationError:
+            file.close()
+            raise
+        file.seek(0)
+        return UploadedFile(
+            file,
+            name=f'{uuid.uuid4()}.{EXTENSIONS[image_format]}',
+            content_type=f'image/{image_format}',
+            size=size
+        )
+
+    def write_payload(self, payload, file):
+        size = 0
+        image_format = None
+        for start in range(0, len(payload), self.chunk_size):
+            chunk = base64.b64decode(
+                payload[start:start + self.chunk_size], validate=True)
+            if image_format is None:
+                image_format = self.get_format(chunk)
+            size += len(chunk)
+            if size > settings.IMAGE_UPLOAD_MAX_BYTES:
+                self.fail('max_bytes',
+                          max_bytes=settings.IMAGE_UPLOAD_MAX_BYTES)
+            file.write(chunk)
+        if image_format is None:
+            self.fail('invalid_data')
+        return size, image_format
+
+    def get_format(self, header):
+        image_format = detect_format(header[:HEADER_SIZE])
+        if image_format not in settings.IMAGE_UPLOAD_FORMATS:
+            self.fail('invalid_format',
+                      formats=', '.join(settings.IMAGE_UPLOAD_FORMATS))
+        return image_format
+
+    def check_image(self, file):
+        file.seek(0)
+        self.get_format(file.read(HEADER_SIZE))
+        file.seek(0)
+        try:
+            with Image.open(file) as image:
+                width, height = image.size
+                if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+                    self.fail('max_pixels',
+                              max_pixels=settings.IMAGE_UPLOAD_MAX_PIXELS)
+                image.verify()
+        except (OSError, SyntaxError, ValueError,
+                Image.DecompressionBombError):
+            self.fail('invalid_image')
+        file.seek(0)
@@ -1,21 +1,32 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import filters, FilterSet
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Ingredient, Recipe
+from recipes.tag_cache import tag_cache
 
 
 class RecipeFilter(FilterSet):
     """Фильтры рецептов."""
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all()
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_cache.get_choices,
+        method='get_tags'
     )
     is_favorited = filters.BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart')
+    search = filters.CharFilter(method='get_search')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'По популярности'),),
+        method='get_ordering'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'search', 'ordering')
+
+    def get_tags(self, queryset, name, value):
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'), tag__in=tag_cache.get_ids(value))))
 
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated:
@@ -27,6 +38,14 @@ class RecipeFilter(FilterSet):
             return queryset.filter(shopping_carts__user=self.request.user)
         return queryset
 
+    def get_search(self, queryset, name, value):
+        if not value.strip():
+            return queryset
+        return queryset.search(value)
+
+    def get_ordering(self, queryset, name, value):
+        return queryset.popular()
+
 
 class IngredientFilter(FilterSet):
     """Фильтры ингредиентов."""
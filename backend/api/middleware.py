@@ -0,0 +1,195 @@
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('api.metrics')
+
+
+class QueryBudgetExceeded(Exception):
+    """Эндпоинт выполнил больше запросов к базе, чем разрешено."""
+
+
+class QueryCounter:
+    """Обёртка выполнения запросов: считает их число и время."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class EndpointMetrics:
+    """Накопленные метрики эндпоинтов в памяти процесса."""
+    fields = ('requests', 'queries', 'db_seconds', 'render_seconds',
+              'duration_seconds', 'response_bytes')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = defaultdict(lambda: dict.fromkeys(self.fields, 0))
+
+    def add(self, endpoint, **values):
+        with self._lock:
+            metrics = self._values[endpoint]
+            metrics['requests'] += 1
+            for name, value in values.items():
+                metrics[name] += value
+
+    def to_prometheus(self):
+        """Метрики в текстовом формате Prometheus."""
+        with self._lock:
+            values = {endpoint: dict(metrics)
+                      for endpoint, metrics in self._values.items()}
+        lines = []
+        for name in self.fields:
+            metric = f'foodgram_endpoint_{name}_total'
+            lines.append(f'# TYPE {metric} counter')
+            for endpoint, metrics in sorted(values.items()):
+                lines.append(
+                    f'{metric}{{endpoint="{endpoint}"}} {metrics[name]}')
+        return '\n'.join(lines) + '\n'
+
+
+endpoint_metrics = EndpointMetrics()
+
+
+def get_endpoint(view_func, method):
+    """Имя эндпоинта вида RecipeViewSet.list."""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', 'unknown')
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method.lower(), method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+class QueryBudgetMiddleware:
+    """Число и время запросов к базе, время рендеринга и размер ответа.
+
+    Добавляет заголовок Server-Timing, пишет строку в лог api.metrics
+    и сверяет число запросов с QUERY_BUDGETS: при превышении пишет
+    предупреждение или, если QUERY_BUDGET_RAISE, выбрасывает исключение.
+    Тело потокового ответа формируется после выхода из представления:
+    запросы при его чтении тоже учитываются, а метрики записываются,
+    когда поток прочитан или закрыт. Заголовок Server-Timing отправляется
+    раньше тела, поэтому у таких ответов учитывает только представление.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        request.metrics_endpoint = None
+        request.metrics_render = 0
+        started = time.perf_counter()
+        with self.counting(counter):
+            response = self.get_response(request)
+        if request.metrics_endpoint is None:
+            return response
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={counter.duration * 1000:.1f};'
+            f'desc="{counter.count} queries"',
+            f'render;dur={request.metrics_render * 1000:.1f}',
+            f'total;dur={(time.perf_counter() - started) * 1000:.1f}',
+        ))
+        if response.streaming:
+            response.streaming_content = self.count_stream(
+                response.streaming_content, counter,
+                lambda size, complete: self.record(
+                    request, response, counter, started, size, complete))
+            return response
+        self.record(request, response, counter, started,
+                    len(response.content))
+        return response
+
+    @staticmethod
+    def counting(counter):
+        """Контекст, в котором counter учитывает запросы всех баз."""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        return stack
+
+    def count_stream(self, content, counter, finish):
+        """Части тела потокового ответа с учётом запросов при их чтении.
+
+        Счётчик подключается только на время получения очередной части,
+        поэтому не учитывает чужие запросы между частями.
+        """
+        iterator = iter(content)
+        size = 0
+        complete = False
+        try:
+            while True:
+                with self.counting(counter):
+                    chunk = next(iterator, None)
+                if chunk is None:
+                    complete = True
+                    break
+                size += len(chunk)
+                yield chunk
+        finally:
+            finish(size, complete)
+
+    def record(self, request, response, counter, started, size,
+               check=True):
+        """Запись метрик ответа; check — сверить число запросов с бюджетом
+        (не сверяется у потока, закрытого до конца)."""
+        endpoint = request.metrics_endpoint
+        duration = time.perf_counter() - started
+        endpoint_metrics.add(
+            endpoint,
+            queries=counter.count,
+            db_seconds=counter.duration,
+            render_seconds=request.metrics_render,
+            duration_seconds=duration,
+            response_bytes=size,
+        )
+        logger.info(json.dumps({
+            'endpoint': endpoint,
+            'method': request.method,
+            'status': response.status_code,
+            'queries': counter.count,
+            'db_ms': round(counter.duration * 1000, 1),
+            'render_ms': round(request.metrics_render * 1000, 1),
+            'total_ms': round(duration * 1000, 1),
+            'response_bytes': size,
+        }))
+        if check:
+            self.check_budget(endpoint, counter.count)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_endpoint = get_endpoint(view_func, request.method)
+
+    def process_template_response(self, request, response):
+        started = time.perf_counter()
+
+        def stop_timer(response):
+            request.metrics_render = time.perf_counter() - started
+
+        response.add_post_render_callback(stop_timer)
+        return response
+
+    @staticmethod
+    def check_budget(endpoint, count):
+        budget = settings.QUERY_BUDGETS.get(endpoint)
+        if budget is None or count <= budget:
+            return
+        message = (f'{endpoint}: {count} запросов к базе '
+                   f'при бюджете {budget}')
+        if settings.QUERY_BUDGET_RAISE:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
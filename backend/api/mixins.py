@@ -0,0 +1,70 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from recipes.versions import get_table_version, get_version_tag
+from .cache import response_cache
+
+
+class ConditionalReferenceMixin:
+    """ETag, Last-Modified и Cache-Control для справочников.
+
+    Условные запросы получают 304 по версии таблицы (recipes.versions),
+    не читая сами записи.
+    """
+
+    def get_etag(self, request, *args, **kwargs):
+        # Представления для разных Accept (json, browsable API) различны.
+        path = md5('\n'.join((
+            request.get_full_path(), request.META.get('HTTP_ACCEPT', '')
+        )).encode()).hexdigest()
+        version = get_version_tag(self.queryset.model)
+        return f'{self.basename}-{version}-{path}'
+
+    def get_last_modified(self, request, *args, **kwargs):
+        return get_table_version(self.queryset.model)[1]
+
+    def dispatch(self, request, *args, **kwargs):
+        view = condition(
+            etag_func=self.get_etag,
+            last_modified_func=self.get_last_modified
+        )(super().dispatch)
+        response = view(request, *args, **kwargs)
+        if request.method in ('GET', 'HEAD') and response.status_code in (
+                200, 304):
+            patch_cache_control(
+                response,
+                public=True,
+                max_age=settings.REFERENCE_CACHE_MAX_AGE
+            )
+        return response
+
+
+class CachedListMixin:
+    """Список отдаётся готовым json из кеша, минуя сериализацию.
+
+    В кеше хранится только json; заголовок Vary: Accept не даёт кешам
+    HTTP отдать его на запрос другого формата.
+    """
+
+    def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        key = response_cache.get_key(
+            self.queryset.model, self.basename, request.get_full_path())
+        content = response_cache.get(key)
+        if content is None:
+            response = super().list(request, *args, **kwargs)
+            content = renderer.render(
+                response.data,
+                request.accepted_media_type,
+                self.get_renderer_context()
+            )
+            response_cache.set(key, content)
+        response = HttpResponse(content, content_type=renderer.media_type)
+        patch_vary_headers(response, ('Accept',))
+        return response
@@ -1,6 +1,177 @@
-from rest_framework.pagination import PageNumberPagination
+import datetime
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Даты в курсоре с микросекундами.
+
+    DjangoJSONEncoder округляет время до миллисекунд, и значение из курсора
+    не совпадало бы со значением в базе данных.
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPaginator(BasePagination):
+    """Постраничный вывод по ключу сортировки, без OFFSET и COUNT.
+
+    Курсор хранит значения полей ordering последнего объекта страницы,
+    поэтому любая страница выбирается по индексу так же быстро, как первая.
+    """
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = None
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size < 1:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, view, queryset):
+        """Сортировка модели с первичным ключом для однозначности."""
+        ordering = getattr(view, 'keyset_ordering', self.ordering)
+        if ordering:
+            return ordering
+        ordering = [field for field in queryset.model._meta.ordering
+                    if isinstance(field, str)]
+        pk_name = queryset.model._meta.pk.name
+        if not any(field.lstrip('-') in (pk_name, 'pk')
+                   for field in ordering):
+            descending = bool(ordering) and ordering[-1].startswith('-')
+            ordering.append(f'-{pk_name}' if descending else pk_name)
+        return ordering
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(urlsafe_b64decode(encoded.encode()))
+        except (BinasciiError, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def encode_cursor(self, obj):
+        if isinstance(obj, dict):
+            values = [obj[field] for field, descending in self.fields]
+        else:
+            values = [getattr(obj, field)
+                      for field, descending in self.fields]
+        return urlsafe_b64encode(
+            json.dumps(values, cls=CursorEncoder).encode()).decode()
+
+    def get_keyset_filter(self, values):
+        """(a, b) после (x, y): a > x или (a = x и b > y)."""
+        keyset_filter = Q()
+        equal = Q()
+        for (field, descending), value in zip(self.fields, values):
+            lookup = 'lt' if descending else 'gt'
+            keyset_filter |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return keyset_filter
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        ordering = self.get_ordering(view, queryset)
+        self.fields = [(field.lstrip('-'), field.startswith('-'))
+                       for field in ordering]
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*ordering)
+        values = self.decode_cursor(request)
+        if values is not None:
+            queryset = queryset.filter(self.get_keyset_filter(values))
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        self.page = results[:page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data
+        })
+
+
+def get_estimated_count(queryset):
+    """Оценка числа строк таблицы из статистики PostgreSQL (pg_class).
+
+    Возвращает None, если оценка неприменима: запрос с фильтрами, другая
+    СУБД или таблица меньше PAGINATION_ESTIMATED_COUNT_THRESHOLD строк.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or queryset.query.where:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            (queryset.model._meta.db_table,)
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < settings.PAGINATION_ESTIMATED_COUNT_THRESHOLD:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator с приблизительным count для больших таблиц."""
+
+    @cached_property
+    def count(self):
+        if settings.PAGINATION_ESTIMATED_COUNT:
+            estimate = get_estimated_count(self.object_list)
+            if estimate is not None:
+                return estimate
+        return super().count
 
 
 class CustomPaginator(PageNumberPagination):
+    """Постраничный вывод по номеру страницы или по курсору (?cursor=)."""
     page_size_query_param = 'limit'
     page_query_param = 'page'
+    cursor_query_param = 'cursor'
+    django_paginator_class = EstimatedCountPaginator
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+        self.keyset = KeysetPaginator()
+        self.keyset.page_size = self.get_page_size(request)
+        return self.keyset.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
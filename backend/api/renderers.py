@@ -0,0 +1,66 @@
+import csv
+import json
+from abc import ABC, abstractmethod
+
+from rest_framework.renderers import BaseRenderer
+
+
+class Echo:
+    """Буфер, который сразу возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingCartRenderer(ABC, BaseRenderer):
+    """Базовый класс выгрузки списка покупок построчно."""
+    charset = 'utf-8'
+
+    @abstractmethod
+    def stream(self, items):
+        """Строки файла для элементов списка покупок."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            return json.dumps(data, ensure_ascii=False).encode(self.charset)
+        return ''.join(self.stream(data)).encode(self.charset)
+
+
+class ShoppingCartTextRenderer(ShoppingCartRenderer):
+    """Список покупок в текстовом файле."""
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, items):
+        for item in items:
+            yield f"{item['name']} ({item['units']}) - {item['total']}\n"
+
+
+class ShoppingCartCSVRenderer(ShoppingCartRenderer):
+    """Список покупок в csv файле."""
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, items):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'measurement_unit', 'amount'))
+        for item in items:
+            yield writer.writerow(
+                (item['name'], item['units'], item['total']))
+
+
+class ShoppingCartJSONRenderer(ShoppingCartRenderer):
+    """Список покупок в json файле."""
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, items):
+        yield '['
+        for number, item in enumerate(items):
+            yield (',' if number else '') + json.dumps(
+                {'name': item['name'],
+                 'measurement_unit': item['units'],
+                 'amount': item['total']},
+                ensure_ascii=False
+            )
+        yield ']'
@@ -1,19 +1,39 @@
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import UserCreateSerializer
 from rest_framework import serializers
-from drf_base64.fields import Base64ImageField
 
+from .fields import StreamingImageField
+
+from recipes.images import get_variant_name
 from recipes.models import (
     Favorite,
     Ingredient,
     IngredientInRecipe,
     Tag,
     Recipe,
-    ShoppingCart
+    ShoppingCart,
+    ShoppingListItem
 )
 from users.models import Subscribe, User
 
 
+def get_recipes_limit(request):
+    """Значение параметра recipes_limit или None, если он не передан."""
+    limit = request.query_params.get('recipes_limit')
+    if limit in (None, ''):
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = -1
+    if limit < 0:
+        raise serializers.ValidationError(
+            {'recipes_limit': 'Укажите целое неотрицательное число!'})
+    return limit
+
+
 class UserGetSerializer(UserCreateSerializer):
     """Сериалайзер для модели пользователей, просмотр."""
     is_subscribed = serializers.SerializerMethodField()
@@ -29,6 +49,8 @@ class UserGetSerializer(UserCreateSerializer):
         model = User
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return (self.context['request'].user.is_authenticated
                 and Subscribe.objects.filter(
                     author=obj, user=self.context['request'].user).exists()
@@ -70,6 +92,8 @@ class SubscriptionsSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return (
             self.context.get('request').user.is_authenticated
             and Subscribe.objects.filter(user=self.context['request'].user,
@@ -77,45 +101,23 @@ class SubscriptionsSerializer(serializers.ModelSerializer):
         )
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
+        if hasattr(obj, 'recipes_preview'):
+            recipes = obj.recipes_preview
+        else:
+            limit = get_recipes_limit(self.context.get('request'))
+            recipes = obj.recipes.all()
+            if limit is not None:
+                recipes = recipes[:limit]
         serializer = RecipeMinifiedSerializer(
             recipes, many=True, read_only=True)
         return serializer.data
 
 
-class SubscribeSerializer(serializers.ModelSerializer):
-    """Сериалайзер для модели подписок на авторов.."""
-
-    class Meta:
-        fields = '__all__'
-        model = Subscribe
-        validators = (
-            serializers.UniqueTogetherValidator(
-                queryset=Subscribe.objects.all(),
-                fields=('user', 'author'),
-                message='Вы уже подписаны на этого автора!'
-            ),
-        )
-
-    def validate_author(self, data):
-        """Проверка подписки на самого себя."""
-        if self.context['request'].user == data:
-            raise serializers.ValidationError(
-                'Вы не можете подписаться на самого себя!')
-        return data
-
-    def to_representation(self, instance):
-        instance = instance['author']
-        return SubscriptionsSerializer(instance, context=self.context).data
-
-
 class IngredientSerializer(serializers.ModelSerializer):
     """Сериалайзер для модели ингридиентов."""
 
@@ -170,6 +172,42 @@ class IngredientInRecipeCreateSerializer(serializers.ModelSerializer):
             ingredient_in_recipe.save()
 
 
+class RecipeImageField(serializers.ImageField):
+    """Изображение рецепта: ссылка на уменьшенную копию, если она готова.
+
+    Без variant размер выбирается по действию: карточка для списков,
+    полный размер для остальных запросов.
+    """
+    list_actions = ('list', 'feed', 'what_to_cook')
+
+    def __init__(self, variant=None, **kwargs):
+        self.variant = variant
+        super().__init__(**kwargs)
+
+    def get_variant(self):
+        if self.variant is not None:
+            return self.variant
+        view = self.context.get('view')
+        if getattr(view, 'action', None) in self.list_actions:
+            return 'card'
+        return 'full'
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        name = get_variant_name(value.instance, self.get_variant())
+        if name is None:
+            return super().to_representation(value)
+        return self.get_url(value, name)
+
+    def get_url(self, value, name):
+        url = value.storage.url(name)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
 class TagSerializer(serializers.ModelSerializer):
     """Сериалайзер для модели тегов."""
 
@@ -181,7 +219,8 @@ class TagSerializer(serializers.ModelSerializer):
 class RecipeListSerializer(serializers.ModelSerializer):
     """Сериалайзер для модели рецептов."""
     author = UserGetSerializer(read_only=True)
-    image = Base64ImageField()
+    image = RecipeImageField()
+    image_variants = serializers.SerializerMethodField()
     tags = TagSerializer(many=True, read_only=True)
     ingredients = IngredientInRecipeSerializer(
         many=True,
@@ -193,25 +232,66 @@ class RecipeListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        exclude = ('pub_date',)
+        fields = ('id', 'author', 'image', 'image_variants', 'tags',
+                  'ingredients', 'is_favorited', 'is_in_shopping_cart',
+                  'name', 'text', 'cooking_time')
+
+    def get_image_variants(self, obj):
+        variants = obj.image_variants or {}
+        if variants.get('source') != obj.image.name:
+            return {}
+        field = self.fields['image']
+        return {
+            variant: {image_format: field.get_url(obj.image, name)
+                      for image_format, name in formats.items()}
+            for variant, formats in variants.items() if variant != 'source'
+        }
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
         if user.is_anonymous:
             return False
         return Favorite.objects.filter(user=user, recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
         if user.is_anonymous:
             return False
         return ShoppingCart.objects.filter(user=user, recipe=obj).exists()
 
+    def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
+
+class RecipeMatchSerializer(RecipeListSerializer):
+    """Рецепт с числом совпавших и списком недостающих ингредиентов."""
+    matched_count = serializers.IntegerField(read_only=True)
+    missing_count = serializers.IntegerField(read_only=True)
+    missing_ingredients = serializers.SerializerMethodField()
+
+    class Meta(RecipeListSerializer.Meta):
+        fields = RecipeListSerializer.Meta.fields + (
+            'matched_count', 'missing_count', 'missing_ingredients')
+
+    def get_missing_ingredients(self, obj):
+        available = self.context['ingredients']
+        return IngredientInRecipeSerializer(
+            [item for item in obj.recipes.all()
+             if item.ingredient_id not in available],
+            many=True
+        ).data
+
 
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     """Сериалайзер для модели рецептов."""
     author = UserGetSerializer(read_only=True)
-    image = Base64ImageField()
+    image = StreamingImageField()
     ingredients = IngredientInRecipeCreateSerializer(many=True)
     tags = serializers.PrimaryKeyRelatedField(
         many=True,
@@ -220,20 +300,24 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        exclude = ('pub_date',)
+        fields = ('id', 'author', 'image', 'ingredients', 'tags', 'name',
+                  'text', 'cooking_time')
 
     def validate_ingredients(self, data):
         if len(data) < 1:
             raise serializers.ValidationError('Нужно добавить ингредиент!')
-        ingredients = []
-        for i, val in enumerate(data):
-            if not Ingredient.objects.filter(id=val['id']).exists():
-                raise serializers.ValidationError(
-                    'Нужно выбрать ингредиент из представленных!')
-            ingredients.append(val['id'])
+        ingredients = [val['id'] for val in data]
         if len(ingredients) != len(set(ingredients)):
             raise serializers.ValidationError(
                 'Ингредиенты не должны повторяться!')
+        existing = Ingredient.objects.in_bulk(ingredients)
+        missing = [pk for pk in ingredients if pk not in existing]
+        if missing:
+            raise serializers.ValidationError(
+                'Нужно выбрать ингредиент из представленных! '
+                f'Не найдены: {", ".join(map(str, missing))}.')
+        for val in data:
+            val['ingredient'] = existing[val['id']]
         return data
 
     def validate_amount(self, data):
@@ -248,6 +332,56 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
                 'Время приготовления не может быть меньше 1 минуты!')
         return data
 
+    @staticmethod
+    def create_ingredients(recipe, ingredients, count=None):
+        """Добавление ингредиентов, найденных при валидации, в рецепт.
+
+        count — число ингредиентов рецепта после изменения, если
+        добавляется только часть из них.
+        """
+        IngredientInRecipe.objects.bulk_create(
+            [IngredientInRecipe(
+                recipe=recipe,
+                ingredient=ingredient['ingredient'],
+                amount=ingredient['amount'],
+                ingredients_count=len(ingredients) if count is None else count,
+                cooking_time=recipe.cooking_time
+            ) for ingredient in ingredients]
+        )
+
+    def update_ingredients(self, recipe, ingredients):
+        """Изменение только отличающихся ингредиентов рецепта."""
+        current = {item.ingredient_id: item for item in recipe.recipes.all()}
+        new = {ingredient['id']: ingredient for ingredient in ingredients}
+        removed = current.keys() - new.keys()
+        if removed:
+            IngredientInRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed).delete()
+        deltas = {
+            ingredient_id: ingredient['amount']
+            - getattr(current.get(ingredient_id), 'amount', 0)
+            for ingredient_id, ingredient in new.items()
+        }
+        deltas.update(
+            {ingredient_id: -current[ingredient_id].amount
+             for ingredient_id in removed}
+        )
+        changed = []
+        for ingredient_id, item in current.items():
+            if (ingredient_id in new
+                    and item.amount != new[ingredient_id]['amount']):
+                item.amount = new[ingredient_id]['amount']
+                changed.append(item)
+        IngredientInRecipe.objects.bulk_update(changed, ('amount',))
+        self.create_ingredients(
+            recipe,
+            [ingredient for ingredient_id, ingredient in new.items()
+             if ingredient_id not in current],
+            count=len(new)
+        )
+        ShoppingListItem.objects.apply(
+            recipe.shopping_carts.values_list('user_id', flat=True), deltas)
+
     @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
@@ -255,13 +389,8 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(**validated_data,
                                        author=self.context['request'].user)
         recipe.tags.set(tags)
-        IngredientInRecipe.objects.bulk_create(
-            [IngredientInRecipe(
-                recipe=recipe,
-                ingredient=Ingredient.objects.get(id=ingredient['id']),
-                amount=ingredient['amount']
-            ) for ingredient in ingredients]
-        )
+        self.create_ingredients(recipe, ingredients)
+        Recipe.objects.filter(pk=recipe.pk).update_search_vector()
         return recipe
 
     @transaction.atomic
@@ -270,63 +399,65 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         tags = validated_data.pop('tags', None)
         if tags is not None:
             instance.tags.set(tags)
+        instance = super().update(instance, validated_data)
+        # Строки ингредиентов перезаписываются, только если изменились
+        # число ингредиентов или время приготовления.
+        values = {}
         if ingredients is not None:
-            instance.ingredients.clear()
-            IngredientInRecipe.objects.bulk_create(
-                [IngredientInRecipe(
-                    recipe=instance,
-                    ingredient=Ingredient.objects.get(id=ingredient['id']),
-                    amount=ingredient['amount']
-                ) for ingredient in ingredients]
-            )
-
-        return super().update(instance, validated_data)
+            self.update_ingredients(instance, ingredients)
+            values['ingredients_count'] = len(ingredients)
+        if 'cooking_time' in validated_data:
+            values['cooking_time'] = instance.cooking_time
+        if values:
+            instance.recipes.set_recipe_fields(**values)
+        Recipe.objects.filter(pk=instance.pk).update_search_vector()
+        return instance
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance],
+            'tags',
+            Prefetch(
+                'recipes',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient')
+            ),
+        )
         return RecipeListSerializer(instance, context=self.context).data
 
 
 class RecipeMinifiedSerializer(serializers.ModelSerializer):
     """Сериалайзер для рецепта без ингридиентов."""
+    image = RecipeImageField(variant='thumbnail', read_only=True)
 
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
-    """Сериалайзер для модели избранное."""
-
-    class Meta:
-        fields = ('user', 'recipe')
-        model = Favorite
-        validators = (
-            serializers.UniqueTogetherValidator(
-                queryset=Favorite.objects.all(),
-                fields=('user', 'recipe'),
-                message='Вы уже добавили этот рецепт в избранное!'
-            ),
-        )
-
-    def to_representation(self, instance):
-        instance = instance['recipe']
-        return RecipeMinifiedSerializer(instance, context=self.context).data
+class SimilarRecipeSerializer(RecipeMinifiedSerializer):
+    """Похожий рецепт с оценкой сходства."""
+    score = serializers.FloatField(source='similar_score', read_only=True)
 
+    class Meta(RecipeMinifiedSerializer.Meta):
+        fields = RecipeMinifiedSerializer.Meta.fields + ('score',)
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
-    """Сериалайзер для списка покупок."""
 
-    class Meta:
-        fields = ('user', 'recipe')
-        model = ShoppingCart
+class BatchIdsSerializer(serializers.Serializer):
+    """Список id для пакетного добавления и удаления."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_MAX_SIZE
+    )
 
-    def validate_recipe(self, data):
-        print(data)
-        user = self.context['request'].user
-        if ShoppingCart.objects.filter(recipe=data, user=user).exists():
-            raise serializers.ValidationError('Рецепт уже в корзине.')
-        return data
 
-    def to_representation(self, instance):
-        instance = instance['recipe']
-        return RecipeMinifiedSerializer(instance).data
+class CookableSerializer(serializers.Serializer):
+    """Параметры подбора рецептов по имеющимся ингредиентам."""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.COOKABLE_MAX_INGREDIENTS
+    )
+    max_missing = serializers.IntegerField(min_value=0, required=False)
+    cooking_time = serializers.IntegerField(min_value=1, required=False)
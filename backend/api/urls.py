@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
@@ -6,6 +7,8 @@ from .views import (
     RecipeViewSet,
     TagViewSet,
     CustomUserViewSet,
+    metrics,
+    response_cache_stats,
 )
 
 app_name = 'api'
@@ -18,7 +21,11 @@ router.register(r'recipes', RecipeViewSet, basename='recipes')
 
 
 urlpatterns = [
+    path('cache/stats/', response_cache_stats, name='response_cache_stats'),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
 ]
+
+if settings.METRICS_ENDPOINT_ENABLED:
+    urlpatterns.insert(0, path('metrics/', metrics, name='metrics'))
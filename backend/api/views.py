@@ -1,39 +1,102 @@
-from django.db.models import Sum, F
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (BooleanField, Count, Exists, F, OuterRef,
+                              Prefetch, Value, prefetch_related_objects)
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.serializers import SetPasswordSerializer
 from djoser.views import UserViewSet
 from rest_framework import (filters, status, mixins)
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.response import Response
-from rest_framework.permissions import (AllowAny, IsAuthenticated)
+from rest_framework.permissions import (AllowAny, IsAdminUser,
+                                        IsAuthenticated)
+from rest_framework.settings import api_settings
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
 
 from .filters import RecipeFilter, IngredientFilter
+from .cache import response_cache
+from .middleware import endpoint_metrics
+from .mixins import CachedListMixin, ConditionalReferenceMixin
 from .serializers import (
-    FavoriteSerializer,
+    BatchIdsSerializer,
+    CookableSerializer,
     IngredientSerializer,
     RecipeListSerializer,
     RecipeCreateUpdateSerializer,
+    RecipeMatchSerializer,
+    RecipeMinifiedSerializer,
+    SimilarRecipeSerializer,
     TagSerializer,
-    ShoppingCartSerializer,
-    SubscribeSerializer,
     SubscriptionsSerializer,
     UserGetSerializer,
-    UserPostSerializer
+    UserPostSerializer,
+    get_recipes_limit
 )
+from recipes.autocomplete import ingredient_index
 from recipes.models import (
+    COOKABLE_ORDERING,
+    POPULAR_ORDERING,
+    SEARCH_ORDERING,
     Favorite,
     Ingredient,
     IngredientInRecipe,
     Recipe,
     Tag,
-    ShoppingCart
+    ShoppingCart,
+    ShoppingListItem
 )
 from users.models import Subscribe, User
 from .permissions import IsAuthorOnly
-from .pagination import CustomPaginator
+from .pagination import CustomPaginator, KeysetPaginator
+from .renderers import (
+    ShoppingCartCSVRenderer,
+    ShoppingCartJSONRenderer,
+    ShoppingCartTextRenderer
+)
+
+
+def get_batch_ids(request):
+    """Id из тела запроса {"ids": [...]} или из параметра ?ids=1,2,3."""
+    data = request.data
+    if not data:
+        data = {'ids': [pk for pk in request.query_params.get(
+            'ids', '').split(',') if pk]}
+    serializer = BatchIdsSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    return list(dict.fromkeys(serializer.validated_data['ids']))
+
+
+def batch_toggle(request, links, queryset, excluded=()):
+    """Пакетное добавление (POST) или удаление (DELETE) связей.
+
+    Связи изменяются одним запросом через links.add или links.remove;
+    существование объектов проверяется только для id, которые не
+    изменились. Возвращает результат для каждого id.
+    """
+    ids = get_batch_ids(request)
+    adding = request.method == 'POST'
+    change = links.add if adding else links.remove
+    changed = set(change(
+        request.user, [pk for pk in ids if pk not in excluded]))
+    unchanged = [pk for pk in ids if pk not in changed]
+    found = set(queryset.filter(id__in=unchanged).values_list(
+        'id', flat=True)) if unchanged else set()
+    results = []
+    for pk in ids:
+        if pk in changed:
+            outcome = 'created' if adding else 'deleted'
+        elif pk not in found:
+            outcome = 'not_found'
+        elif pk in excluded:
+            outcome = 'forbidden'
+        else:
+            outcome = 'exists' if adding else 'absent'
+        results.append({'id': pk, 'status': outcome})
+    return Response({'results': results})
 
 
 class CustomUserViewSet(UserViewSet):
@@ -44,8 +107,17 @@ class CustomUserViewSet(UserViewSet):
     pagination_class = CustomPaginator
     search_fields = ('username', 'email')
     lookup_fields = ('name', 'id')
+    lookup_value_regex = r'\d+'
     http_method_names = ['get', 'post', 'delete']
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if self.action in ('list', 'retrieve') and user.is_authenticated:
+            queryset = queryset.annotate(is_subscribed=Exists(
+                Subscribe.objects.filter(user=user, author=OuterRef('pk'))))
+        return queryset
+
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return UserGetSerializer
@@ -64,35 +136,59 @@ class CustomUserViewSet(UserViewSet):
             permission_classes=[IsAuthenticated])
     def subscribe(self, request, **kwargs):
         """Метод создания подписки на автора."""
-        author = get_object_or_404(User, id=kwargs['id'])
         user = request.user
+        author_id = int(kwargs['id'])
         if request.method == 'POST':
-            serializer = SubscribeSerializer(
-                data={'user': user.id, 'author': author.id},
-                context={"request": request})
-            serializer.is_valid(raise_exception=True)
-            Subscribe.objects.create(user=user, author=author)
+            author = get_object_or_404(User, id=author_id)
+            if author == user:
+                raise ValidationError(
+                    {'author': ['Вы не можете подписаться на самого себя!']})
+            if not Subscribe.objects.add(user, [author.id]):
+                raise ValidationError(
+                    {api_settings.NON_FIELD_ERRORS_KEY:
+                        ['Вы уже подписаны на этого автора!']})
+            serializer = SubscriptionsSerializer(
+                author, context={'request': request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        subscribe = Subscribe.objects.filter(user=user, author=author)
-        if not subscribe:
+        if not Subscribe.objects.remove(user, [author_id]):
+            get_object_or_404(User, id=author_id)
             return Response({'errors': 'Подписки на этого автора нет!'},
                             status=status.HTTP_400_BAD_REQUEST)
-        subscribe.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated], url_path='subscribe')
+    def subscribe_batch(self, request):
+        """Пакетная подписка на авторов и отписка: {"ids": [...]}."""
+        return batch_toggle(request, Subscribe.objects, User.objects.all(),
+                            excluded=(request.user.id,))
+
     @action(detail=False, methods=['get'],
             permission_classes=[IsAuthorOnly])
     def subscriptions(self, request):
         """Метод получения всех подписок."""
-        queryset = User.objects.filter(following__user=request.user)
+        limit = get_recipes_limit(request)
+        queryset = User.objects.filter(
+            following__user=request.user
+        ).annotate(
+            recipes_count=Count('recipes'),
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).order_by('id')
         page = self.paginate_queryset(queryset)
+        recipes = Recipe.objects.filter(author__in=page)
+        if limit is not None:
+            recipes = recipes.first_per_author(limit)
+        prefetch_related_objects(page, Prefetch(
+            'recipes', queryset=recipes, to_attr='recipes_preview'))
         serializer = SubscriptionsSerializer(
             page, many=True, context={'request': request})
         return self.get_paginated_response(serializer.data)
 
 
-class IngredientViewSet(mixins.ListModelMixin,
+class IngredientViewSet(ConditionalReferenceMixin,
+                        CachedListMixin,
+                        mixins.ListModelMixin,
                         mixins.RetrieveModelMixin,
                         GenericViewSet):
     """Вьюсет для просмотра ингредиентов."""
@@ -104,8 +200,23 @@ class IngredientViewSet(mixins.ListModelMixin,
     filterset_class = IngredientFilter
     search_fields = ('^name',)
 
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """Подсказки ингредиентов: сначала по началу названия."""
+        try:
+            limit = int(request.query_params.get(
+                'limit', settings.INGREDIENT_AUTOCOMPLETE_LIMIT))
+        except ValueError:
+            return Response({'errors': 'limit должен быть числом!'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        limit = min(max(limit, 1), settings.INGREDIENT_AUTOCOMPLETE_MAX_LIMIT)
+        return Response(ingredient_index.search(
+            request.query_params.get('name', ''), limit))
+
 
-class TagViewSet(mixins.ListModelMixin,
+class TagViewSet(ConditionalReferenceMixin,
+                 CachedListMixin,
+                 mixins.ListModelMixin,
                  mixins.RetrieveModelMixin,
                  GenericViewSet):
     """Вьюсет для просмотра тегов."""
@@ -115,61 +226,196 @@ class TagViewSet(mixins.ListModelMixin,
     pagination_class = None
 
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def response_cache_stats(request):
+    """Попадания и промахи кеша ответов справочников."""
+    return Response(response_cache.stats())
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def metrics(request):
+    """Метрики эндпоинтов процесса в формате Prometheus."""
+    return HttpResponse(endpoint_metrics.to_prometheus(),
+                        content_type='text/plain; version=0.0.4')
+
+
 class RecipeViewSet(ModelViewSet):
     """Вьюсет для просмотра рецептов."""
     queryset = Recipe.objects.all()
     pagination_class = CustomPaginator
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    parser_classes = (JSONParser, MultiPartParser, FormParser)
     http_method_names = ["get", "post", "patch", "delete"]
+    lookup_value_regex = r'\d+'
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve', 'feed', 'what_to_cook'):
+            queryset = queryset.select_related('author').prefetch_related(
+                Prefetch('tags', queryset=Tag.objects.all()),
+                Prefetch(
+                    'recipes',
+                    queryset=IngredientInRecipe.objects.select_related(
+                        'ingredient')
+                ),
+            ).with_user_flags(self.request.user)
+        return queryset
+
+    @property
+    def keyset_ordering(self):
+        if self.action == 'what_to_cook':
+            return COOKABLE_ORDERING
+        if self.request.query_params.get('ordering') == 'popular':
+            return POPULAR_ORDERING
+        if self.request.query_params.get('search', '').strip():
+            return SEARCH_ORDERING
+        return None
 
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve'):
+        if self.action in ('list', 'retrieve', 'feed'):
             return RecipeListSerializer
         return RecipeCreateUpdateSerializer
 
-    @action(detail=True, methods=['post', 'delete'],
-            permission_classes=[IsAuthenticated])
-    def favorite(self, request, **kwargs):
-        """Метод добавления рецепта в избранное."""
-        recipe = get_object_or_404(Recipe, id=kwargs['pk'])
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        Favorite.objects.remove_recipe(instance)
+        ShoppingCart.objects.remove_recipe(instance)
+        instance.delete()
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated],
+            pagination_class=KeysetPaginator)
+    def feed(self, request):
+        """Метод получения новых рецептов авторов из подписок."""
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            author__following__user=request.user)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    def what_to_cook(self, request):
+        """Рецепты из имеющихся ингредиентов: ?ingredients=1,2,3.
+
+        Сначала рецепты, которым не хватает меньше всего ингредиентов;
+        max_missing ограничивает число недостающих ингредиентов,
+        cooking_time — время приготовления. Рецепты подбираются по индексу
+        ингредиентов, из таблицы рецептов читается только страница.
+        """
+        params = request.query_params
+        data = {name: params[name] for name in ('max_missing', 'cooking_time')
+                if params.get(name)}
+        data['ingredients'] = [pk for value in params.getlist('ingredients')
+                               for pk in value.split(',') if pk]
+        serializer = CookableSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        ingredients = set(serializer.validated_data['ingredients'])
+        matches = IngredientInRecipe.objects.cookable(
+            ingredients,
+            max_missing=serializer.validated_data.get('max_missing'),
+            cooking_time=serializer.validated_data.get('cooking_time')
+        )
+        recipes = self.filter_queryset(Recipe.objects.all())
+        if recipes.query.has_filters():
+            matches = matches.filter(recipe__in=recipes.values('pk'))
+        page = self.paginate_queryset(matches)
+        found = self.get_queryset().in_bulk(
+            [match['recipe_id'] for match in page])
+        results = []
+        for match in page:
+            recipe = found.get(match['recipe_id'])
+            if recipe is not None:
+                recipe.matched_count = match['matched_count']
+                recipe.missing_count = match['missing_count']
+                results.append(recipe)
+        serializer = RecipeMatchSerializer(results, many=True, context={
+            **self.get_serializer_context(), 'ingredients': ingredients})
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'], permission_classes=[AllowAny])
+    def similar(self, request, pk=None):
+        """Рецепты, которые часто добавляют в избранное вместе с данным.
+
+        Читается только индекс похожих рецептов (см. update_similar_recipes)
+        и строки найденных рецептов.
+        """
+        recipes = list(Recipe.objects.similar_to(pk))
+        if not recipes:
+            get_object_or_404(Recipe, pk=pk)
+        return Response(SimilarRecipeSerializer(
+            recipes, many=True, context=self.get_serializer_context()).data)
+
+    @action(detail=False, methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated], url_path='favorite')
+    def favorite_batch(self, request):
+        """Пакетное добавление рецептов в избранное и удаление из него."""
+        return batch_toggle(request, Favorite.objects, Recipe.objects.all())
+
+    @action(detail=False, methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated], url_path='shopping_cart')
+    def shopping_cart_batch(self, request):
+        """Пакетное добавление рецептов в корзину и удаление из неё."""
+        return batch_toggle(
+            request, ShoppingCart.objects, Recipe.objects.all())
+
+    def toggle(self, request, links, pk, exists_errors, missing_error,
+               created_status):
+        """Добавление (POST) или удаление (DELETE) одной связи с рецептом.
+
+        Изменение — один запрос без предварительных проверок, поэтому
+        повторные и одновременные запросы не приводят к ошибке сервера.
+        """
         user = request.user
+        pk = int(pk)
         if request.method == 'POST':
-            serializer = FavoriteSerializer(
-                data={'user': user.id, 'recipe': recipe.id})
-            serializer.is_valid(raise_exception=True)
-            Favorite.objects.create(user=user, recipe=recipe)
-            return Response(serializer.data,
-                            status=status.HTTP_201_CREATED)
-
-        favorite = Favorite.objects.filter(user=user.id, recipe=recipe.id)
-        if not favorite:
-            return Response({'errors': 'Этого рецепта нет в избранном!'},
+            recipe = get_object_or_404(Recipe, id=pk)
+            if not links.add(user, [recipe.id]):
+                raise ValidationError(exists_errors)
+            serializer = RecipeMinifiedSerializer(
+                recipe, context={'request': request})
+            return Response(serializer.data, status=created_status)
+
+        if not links.remove(user, [pk]):
+            get_object_or_404(Recipe, id=pk)
+            return Response({'errors': missing_error},
                             status=status.HTTP_400_BAD_REQUEST)
-        favorite.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=True, methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated])
+    def favorite(self, request, **kwargs):
+        """Метод добавления рецепта в избранное."""
+        return self.toggle(
+            request, Favorite.objects, kwargs['pk'],
+            {api_settings.NON_FIELD_ERRORS_KEY:
+                ['Вы уже добавили этот рецепт в избранное!']},
+            'Этого рецепта нет в избранном!',
+            status.HTTP_201_CREATED
+        )
+
     @action(detail=False, methods=['get'],
-            permission_classes=[IsAuthorOnly])
+            permission_classes=[IsAuthorOnly],
+            renderer_classes=[ShoppingCartTextRenderer,
+                              ShoppingCartCSVRenderer,
+                              ShoppingCartJSONRenderer])
     def download_shopping_cart(self, request):
-        """Метод для просмотра списка покупок."""
-        items = IngredientInRecipe.objects.select_related(
-            'recipe', 'ingredient'
-        )
-        items = items.filter(recipe__shopping_carts__user=request.user).all()
-        shopping_cart = items.values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(
+        """Метод для скачивания списка покупок (?format=txt|csv|json)."""
+        shopping_cart = ShoppingListItem.objects.filter(
+            user=request.user
+        ).values(
+            'total',
             name=F('ingredient__name'),
-            units=F('ingredient__measurement_unit'),
-            total=Sum('amount')
+            units=F('ingredient__measurement_unit')
         ).order_by('-total')
-        text = '\n'.join(
-            [f"{item.get('name')} ({item.get('units')}) - {item.get('total')}"
-             for item in shopping_cart]
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(shopping_cart.iterator()),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
         )
-        filename = 'foodgram_shopping_cart.txt'
-        response = HttpResponse(text, content_type='text/plan')
+        filename = f'foodgram_shopping_cart.{renderer.format}'
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
@@ -177,20 +423,9 @@ class RecipeViewSet(ModelViewSet):
             permission_classes=[IsAuthenticated])
     def shopping_cart(self, request, **kwargs):
         """Метод для создания, удаления списка продуктов для рецептов."""
-        recipe = get_object_or_404(Recipe, id=kwargs['pk'])
-        user = request.user
-        if request.method == 'POST':
-            serializer = ShoppingCartSerializer(
-                data={'user': user.id, 'recipe': recipe.id},
-                context={"request": request})
-            serializer.is_valid(raise_exception=True)
-            ShoppingCart.objects.create(user=user, recipe=recipe)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-
-        shopping_cart = ShoppingCart.objects.filter(
-            recipe=recipe.id, user=user.id)
-        if not shopping_cart:
-            return Response({'errors': 'Этого рецепта нет в списке покупок!'},
-                            status=status.HTTP_400_BAD_REQUEST)
-        shopping_cart.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.toggle(
+            request, ShoppingCart.objects, kwargs['pk'],
+            {'recipe': ['Рецепт уже в корзине.']},
+            'Этого рецепта нет в списке покупок!',
+            status.HTTP_200_OK
+        )
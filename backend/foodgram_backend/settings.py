@@ -33,6 +33,7 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'users.User'
 
 MIDDLEWARE = [
+    'api.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -126,6 +127,109 @@ REST_FRAMEWORK = {
     'SEARCH_PARAM': 'name',
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND',
+                             'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+RESPONSE_CACHE_ALIAS = 'default'
+
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+
+TABLE_VERSION_TIMEOUT = int(os.getenv('TABLE_VERSION_TIMEOUT', 60))
+
+REFERENCE_CACHE_MAX_AGE = int(os.getenv('REFERENCE_CACHE_MAX_AGE', 60))
+
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', 300))
+
+INGREDIENT_AUTOCOMPLETE_LIMIT = 10
+
+INGREDIENT_AUTOCOMPLETE_MAX_LIMIT = 50
+
+IMAGE_QUEUE = os.getenv('IMAGE_QUEUE',
+                        'recipes.images.ThreadPoolImageQueue')
+
+IMAGE_QUEUE_WORKERS = int(os.getenv('IMAGE_QUEUE_WORKERS', 2))
+
+IMAGE_VARIANTS = {
+    'thumbnail': 160,
+    'card': 480,
+    'full': 1280,
+}
+
+IMAGE_VARIANT_FORMATS = ('webp', 'avif')
+
+IMAGE_VARIANT_QUALITY = 80
+
+IMAGE_UPLOAD_MAX_BYTES = int(
+    os.getenv('IMAGE_UPLOAD_MAX_BYTES', 5 * 1024 * 1024))
+
+IMAGE_UPLOAD_MAX_PIXELS = int(
+    os.getenv('IMAGE_UPLOAD_MAX_PIXELS', 25_000_000))
+
+IMAGE_UPLOAD_SPOOL_SIZE = 1024 * 1024
+
+IMAGE_UPLOAD_FORMATS = ('jpeg', 'png', 'gif', 'webp')
+
+BATCH_MAX_SIZE = 100
+
+COOKABLE_MAX_INGREDIENTS = 50
+
+RECOMMENDATIONS_TOP_K = 20
+
+RECOMMENDATIONS_MIN_COUNT = 2
+
+RECOMMENDATIONS_MAX_USER_FAVORITES = 500
+
+RECOMMENDATIONS_CHUNK_SIZE = 10000
+
+RECIPE_SEARCH_CONFIG = 'russian'
+
+PAGINATION_ESTIMATED_COUNT = (
+    os.getenv('PAGINATION_ESTIMATED_COUNT', 'False') == 'True')
+
+PAGINATION_ESTIMATED_COUNT_THRESHOLD = 10000
+
+QUERY_BUDGETS = {
+    'RecipeViewSet.list': 8,
+    'RecipeViewSet.retrieve': 8,
+    'RecipeViewSet.feed': 8,
+    'RecipeViewSet.download_shopping_cart': 4,
+    'CustomUserViewSet.list': 4,
+    'CustomUserViewSet.subscriptions': 6,
+    'IngredientViewSet.list': 3,
+    'IngredientViewSet.autocomplete': 2,
+    'TagViewSet.list': 3,
+}
+
+QUERY_BUDGET_RAISE = os.getenv('QUERY_BUDGET_RAISE', 'False') == 'True'
+
+METRICS_ENDPOINT_ENABLED = (
+    os.getenv('METRICS_ENDPOINT_ENABLED', 'False') == 'True')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.metrics': {
+            'handlers': ['console'],
+            'level': os.getenv('METRICS_LOG_LEVEL', 'INFO'),
+        },
+        'recipes.images': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+    },
+}
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db import transaction
 
 from recipes.models import (
     Favorite,
@@ -6,7 +7,9 @@ from recipes.models import (
     Ingredient,
     Recipe,
     Tag,
-    ShoppingCart
+    ShoppingCart,
+    ShoppingListItem,
+    SimilarRecipesUpdate
 )
 
 
@@ -39,8 +42,9 @@ class RecipeAdmin(admin.ModelAdmin):
                     'text',
                     'image',
                     'favorite_count',
+                    'in_carts_count',
                     'cooking_time')
-    readonly_fields = ('favorite_count',)
+    readonly_fields = ('favorite_count', 'in_carts_count')
     list_filter = ('name', 'author', 'tags')
 
     def tags(self, recipe):
@@ -49,18 +53,62 @@ class RecipeAdmin(admin.ModelAdmin):
             tags.append(tag.name)
         return ' '.join(tags)
 
-    @admin.display(description='В избранном')
+    def save_related(self, request, form, formsets, change):
+        recipe = form.instance
+        before = recipe.recipes.amounts()
+        super().save_related(request, form, formsets, change)
+        after = recipe.recipes.amounts()
+        ShoppingListItem.objects.apply(
+            recipe.shopping_carts.values_list('user_id', flat=True),
+            {pk: after.get(pk, 0) - before.get(pk, 0)
+             for pk in before.keys() | after.keys()}
+        )
+        recipe.recipes.update_recipe_fields()
+        Recipe.objects.filter(pk=recipe.pk).update_search_vector()
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        Favorite.objects.remove_recipe(obj)
+        ShoppingCart.objects.remove_recipe(obj)
+        super().delete_model(request, obj)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        for recipe in queryset:
+            Favorite.objects.remove_recipe(recipe)
+            ShoppingCart.objects.remove_recipe(recipe)
+        super().delete_queryset(request, queryset)
+
+    @admin.display(description='В избранном', ordering='favorites_count')
     def favorite_count(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
 
-@admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class UserRecipeAdmin(admin.ModelAdmin):
+    """Избранное и корзина: счётчики рецептов и списки покупок изменяют
+    сигналы сохранения и удаления (recipes.signals)."""
     list_display = ('id', 'user', 'recipe')
     list_editable = ('user', 'recipe')
 
 
+@admin.register(Favorite)
+class FavoriteAdmin(UserRecipeAdmin):
+    pass
+
+
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'recipe')
-    list_editable = ('user', 'recipe')
+class ShoppingCartAdmin(UserRecipeAdmin):
+    pass
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'ingredient', 'total')
+    list_filter = ('user',)
+
+
+@admin.register(SimilarRecipesUpdate)
+class SimilarRecipesUpdateAdmin(admin.ModelAdmin):
+    list_display = ('id', 'created', 'full', 'last_favorite_id',
+                    'recipes_count', 'neighbours_count')
+    list_filter = ('full',)
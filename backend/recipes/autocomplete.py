@@ -0,0 +1,148 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+
+from recipes.models import Ingredient
+
+NGRAM_SIZE = 3
+
+
+def ngrams(text, size=NGRAM_SIZE):
+    """Все подстроки text длиной от 1 до size символов."""
+    return {text[start:start + length]
+            for length in range(1, size + 1)
+            for start in range(len(text) - length + 1)}
+
+
+class IngredientIndex:
+    """Отсортированный индекс ингредиентов в памяти процесса.
+
+    Первые запросы холодного процесса обслуживаются базой данных, пока
+    индекс загружается в фоне. Индекс сбрасывается сигналами при изменении
+    ингредиентов и перечитывается не реже раза в INGREDIENT_INDEX_TTL секунд,
+    чтобы подхватывать изменения из других процессов.
+
+    Для поиска по вхождению хранятся позиции названий с каждой
+    подстрокой до NGRAM_SIZE символов: проверяются только названия
+    с самой редкой подстрокой запроса, а не весь каталог.
+    """
+
+    def __init__(self):
+        self._index = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._loading = False
+
+    def _get_index(self):
+        index = self._index
+        ttl = getattr(settings, 'INGREDIENT_INDEX_TTL', 300)
+        if index is None or time.monotonic() - index[3] >= ttl:
+            return None
+        return index
+
+    def invalidate(self):
+        self._generation += 1
+        self._index = None
+
+    def load(self):
+        generation = self._generation
+        index = self.build(Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit').order_by().iterator())
+        if generation != self._generation:
+            return
+        self._index = index
+
+    @staticmethod
+    def build(rows):
+        """Индекс из строк (id, название, единица измерения)."""
+        items = sorted(
+            ((name.lower(), {'id': pk,
+                             'name': name,
+                             'measurement_unit': measurement_unit})
+             for pk, name, measurement_unit in rows),
+            key=lambda entry: entry[0]
+        )
+        postings = defaultdict(lambda: array('I'))
+        for position, (key, item) in enumerate(items):
+            for gram in ngrams(key):
+                postings[gram].append(position)
+        return (
+            [key for key, item in items],
+            [item for key, item in items],
+            dict(postings),
+            time.monotonic()
+        )
+
+    def _load_in_background(self):
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+
+        def target():
+            try:
+                self.load()
+            finally:
+                self._loading = False
+                connection.close()
+
+        threading.Thread(target=target, daemon=True).start()
+
+    def search(self, query, limit):
+        """Ингредиенты, начинающиеся с query, затем содержащие query."""
+        query = query.lower()
+        index = self._get_index()
+        if index is None:
+            self._load_in_background()
+            return self.search_database(query, limit)
+        keys, items, postings, loaded_at = index
+        start = bisect_left(keys, query)
+        result = []
+        for position in range(start, len(keys)):
+            if len(result) == limit or not keys[position].startswith(query):
+                break
+            result.append(items[position])
+        if query and len(result) < limit:
+            for position in self.get_candidates(postings, query):
+                key = keys[position]
+                if query in key and not key.startswith(query):
+                    result.append(items[position])
+                    if len(result) == limit:
+                        break
+        return result
+
+    @staticmethod
+    def get_candidates(postings, query):
+        """Позиции названий (по алфавиту), которые могут содержать query.
+
+        Короткий запрос сам является подстрокой индекса, и все его позиции
+        подходят; для длинного берутся позиции самой редкой подстроки.
+        """
+        if len(query) <= NGRAM_SIZE:
+            return postings.get(query, ())
+        return min(
+            (postings.get(query[start:start + NGRAM_SIZE], ())
+             for start in range(len(query) - NGRAM_SIZE + 1)),
+            key=len
+        )
+
+    @staticmethod
+    def search_database(query, limit):
+        prefix = list(Ingredient.objects.filter(
+            name__istartswith=query
+        ).values('id', 'name', 'measurement_unit')[:limit])
+        if query and len(prefix) < limit:
+            prefix += Ingredient.objects.filter(
+                name__icontains=query
+            ).exclude(
+                name__istartswith=query
+            ).values('id', 'name', 'measurement_unit')[:limit - len(prefix)]
+        return prefix
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,128 @@
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.dispatch import receiver
+from django.utils.functional import SimpleLazyObject, empty
+from django.utils.module_loading import import_string
+from PIL import Image, ImageOps, features
+
+from recipes.models import Recipe
+
+logger = logging.getLogger('recipes.images')
+
+VARIANTS_DIR = 'recipes/variants'
+
+
+class SyncImageQueue:
+    """Обработка изображений в текущем потоке (для разработки и отладки)."""
+
+    def enqueue(self, func, *args):
+        func(*args)
+
+
+class ThreadPoolImageQueue:
+    """Обработка изображений в пуле потоков процесса."""
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_QUEUE_WORKERS,
+            thread_name_prefix='recipe-images'
+        )
+
+    def enqueue(self, func, *args):
+        self.executor.submit(self.run, func, *args)
+
+    @staticmethod
+    def run(func, *args):
+        try:
+            func(*args)
+        finally:
+            connection.close()
+
+
+image_queue = SimpleLazyObject(lambda: import_string(settings.IMAGE_QUEUE)())
+
+
+@receiver(setting_changed)
+def reset_image_queue(setting, **kwargs):
+    """override_settings(IMAGE_QUEUE=...) действует и после первого
+    обращения к очереди."""
+    if setting == 'IMAGE_QUEUE':
+        image_queue._wrapped = empty
+
+
+def get_formats():
+    """Форматы вариантов, которые поддерживает установленный Pillow."""
+    return [image_format for image_format in settings.IMAGE_VARIANT_FORMATS
+            if features.check(image_format)]
+
+
+def render_variant(image, size, image_format):
+    variant = image.copy()
+    variant.thumbnail((size, size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    variant.save(buffer, format=image_format.upper(),
+                 quality=settings.IMAGE_VARIANT_QUALITY)
+    return ContentFile(buffer.getvalue())
+
+
+def process_recipe_image(recipe_id, name):
+    """Создаёт уменьшенные копии изображения рецепта в форматах webp/avif.
+
+    Результат сохраняется, только если изображение рецепта не изменилось
+    за время обработки; лишние файлы удаляет collect_orphaned_images.
+    Ошибка отмечается в image_variants, и process_recipe_images повторяет
+    обработку.
+    """
+    storage = Recipe._meta.get_field('image').storage
+    variants = {'source': name}
+    try:
+        with storage.open(name) as f, Image.open(f) as original:
+            image = ImageOps.exif_transpose(original)
+            image = image.convert(
+                'RGBA' if 'A' in image.getbands() else 'RGB')
+            for variant, size in settings.IMAGE_VARIANTS.items():
+                variants[variant] = {}
+                for image_format in get_formats():
+                    variants[variant][image_format] = storage.save(
+                        f'{VARIANTS_DIR}/{variant}.{image_format}',
+                        render_variant(image, size, image_format)
+                    )
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+        variants = {'source': name, 'failed': True}
+    Recipe.objects.filter(pk=recipe_id, image=name).update(
+        image_variants=variants)
+
+
+def is_processed(variants, name):
+    """Копии изображения name созданы без ошибок."""
+    variants = variants or {}
+    return variants.get('source') == name and not variants.get('failed')
+
+
+def schedule_recipe_image(recipe):
+    """Ставит обработку изображения в очередь после фиксации транзакции."""
+    if not recipe.image or is_processed(
+            recipe.image_variants, recipe.image.name):
+        return
+    recipe_id, name = recipe.pk, recipe.image.name
+    transaction.on_commit(
+        lambda: image_queue.enqueue(process_recipe_image, recipe_id, name))
+
+
+def get_variant_name(recipe, variant):
+    """Имя файла варианта изображения в предпочтительном формате или None."""
+    variants = recipe.image_variants or {}
+    if variants.get('source') != recipe.image.name:
+        return None
+    formats = variants.get(variant) or {}
+    for image_format in settings.IMAGE_VARIANT_FORMATS:
+        if image_format in formats:
+            return formats[image_format]
+    return None
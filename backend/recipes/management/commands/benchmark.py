@@ -0,0 +1,340 @@
+import base64
+import io
+import json
+import logging
+import random
+import statistics
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag,
+                            count_related)
+from recipes.recommendations import chunks, update_similar_recipes
+from users.models import Subscribe, User
+
+BATCH_SIZE = 1000
+
+SCENARIOS = (
+    ('recipes', '/api/recipes/'),
+    ('recipes_cursor', '/api/recipes/?cursor='),
+    ('recipes_popular', '/api/recipes/?ordering=popular'),
+    ('recipes_tags', '/api/recipes/?tags=tag0&tags=tag1'),
+    ('recipes_favorited', '/api/recipes/?is_favorited=1'),
+    ('recipes_search', '/api/recipes/?search=ingredient1'),
+    ('recipe_detail', '/api/recipes/{recipe_id}/'),
+    ('recipe_similar', '/api/recipes/{recipe_id}/similar/'),
+    ('what_to_cook',
+     '/api/recipes/what_to_cook/?ingredients={pantry}&max_missing=2'),
+    ('what_to_cook_any', '/api/recipes/what_to_cook/?ingredients={pantry}'),
+    ('feed', '/api/recipes/feed/'),
+    ('download_shopping_cart', '/api/recipes/download_shopping_cart/'),
+    ('subscriptions', '/api/users/subscriptions/?recipes_limit=3'),
+    ('ingredients_name', '/api/ingredients/?name=ingredient1'),
+    ('ingredients_autocomplete',
+     '/api/ingredients/autocomplete/?name=ingredient1'),
+    ('tags', '/api/tags/'),
+)
+
+# Число ингредиентов в рецептах, создаваемых POST /api/recipes/.
+CREATE_RECIPE_INGREDIENTS = (5, 50, 200)
+
+# Число тегов в фильтре ?tags=; стоимость фильтра по тегам заметна на
+# больших данных: --recipes 100000.
+FILTER_TAG_COUNTS = (1, 2, 4, 8)
+
+
+def random_pairs(rng, left, right, count):
+    """Не более count уникальных случайных пар (left, right)."""
+    pairs = set()
+    for _ in range(count * 2):
+        if len(pairs) == count:
+            break
+        pairs.add((rng.choice(left), rng.choice(right)))
+    return pairs
+
+
+def maintain(command):
+    """ANALYZE или VACUUM после массовой загрузки (только PostgreSQL).
+
+    Без статистики планировщик выбирает для подзапросов полный просмотр
+    таблиц на каждую строку, а без карты видимости не использует
+    сканирование только индекса.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(command)
+
+
+def bulk_insert(model, objs):
+    """bulk_create по BATCH_SIZE объектов из генератора: в памяти нет
+    всех строк сразу (bulk_create превращает аргумент в список)."""
+    for batch in chunks(objs, BATCH_SIZE):
+        model.objects.bulk_create(batch)
+
+
+def seed(options):
+    rng = random.Random(options['seed'])
+    password = make_password('benchmark')
+    bulk_insert(User, (
+        User(username=f'user{number}', email=f'user{number}@example.com',
+             password=password)
+        for number in range(options['users'])
+    ))
+    user_ids = list(User.objects.values_list('id', flat=True))
+    bulk_insert(Tag, (
+        Tag(name=f'Тег {number}', slug=f'tag{number}',
+            color=f'#{number:06X}')
+        for number in range(options['tags'])
+    ))
+    tag_ids = list(Tag.objects.values_list('id', flat=True))
+    bulk_insert(Ingredient, (
+        Ingredient(name=f'ingredient{number}', measurement_unit='г')
+        for number in range(options['ingredients'])
+    ))
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+    bulk_insert(Recipe, (
+        Recipe(author_id=rng.choice(user_ids), name=f'Рецепт {number}',
+               text='Описание', image='recipes/media/benchmark.jpg',
+               cooking_time=rng.randint(1, 200))
+        for number in range(options['recipes'])
+    ))
+    cooking_times = dict(Recipe.objects.values_list(
+        'id', 'cooking_time').iterator(chunk_size=BATCH_SIZE))
+    recipe_ids = list(cooking_times)
+    bulk_insert(Recipe.tags.through, (
+        Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+        for recipe_id in recipe_ids
+        for tag_id in rng.sample(tag_ids, min(2, len(tag_ids)))
+    ))
+    per_recipe = min(options['ingredients_per_recipe'], len(ingredient_ids))
+    bulk_insert(IngredientInRecipe, (
+        IngredientInRecipe(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                           amount=rng.randint(1, 500),
+                           ingredients_count=per_recipe,
+                           cooking_time=cooking_times[recipe_id])
+        for recipe_id in recipe_ids
+        for ingredient_id in rng.sample(ingredient_ids, per_recipe)
+    ))
+    bulk_insert(Favorite, (
+        Favorite(user_id=user_id, recipe_id=recipe_id)
+        for user_id, recipe_id in random_pairs(
+            rng, user_ids, recipe_ids, options['favorites'])
+    ))
+    bulk_insert(ShoppingCart, (
+        ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+        for user_id, recipe_id in random_pairs(
+            rng, user_ids, recipe_ids, options['carts'])
+    ))
+    bulk_insert(Subscribe, (
+        Subscribe(user_id=user_id, author_id=author_id)
+        for user_id, author_id in random_pairs(
+            rng, user_ids, user_ids, options['subscriptions'])
+        if user_id != author_id
+    ))
+    maintain('ANALYZE')
+    Recipe.objects.update(
+        favorites_count=count_related(Favorite),
+        in_carts_count=count_related(ShoppingCart),
+    )
+    Recipe.objects.update_search_vector()
+    ShoppingListItem.objects.rebuild()
+    update_similar_recipes(full=True)
+    maintain('VACUUM ANALYZE')
+    return user_ids, recipe_ids
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    position = (len(values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (
+        position - lower)
+
+
+def recipe_payload(ingredient_ids, tag_ids):
+    """Данные для создания рецепта с маленьким изображением PNG."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (32, 32), 'orange').save(buffer, format='PNG')
+    image = base64.b64encode(buffer.getvalue()).decode()
+    return {
+        'name': 'Рецепт',
+        'text': 'Описание',
+        'cooking_time': 30,
+        'image': f'data:image/png;base64,{image}',
+        'tags': tag_ids[:2],
+        'ingredients': [{'id': ingredient_id, 'amount': 10}
+                        for ingredient_id in ingredient_ids],
+    }
+
+
+def measure(client, url, repeat, data=None):
+    """GET-запросы к url или, если передан data, POST-запросы с data."""
+    durations = []
+    queries = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            if data is None:
+                response = client.get(url)
+            else:
+                response = client.post(url, data,
+                                       content_type='application/json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+            durations.append((time.perf_counter() - started) * 1000)
+        if response.status_code not in (200, 201):
+            raise CommandError(f'{url}: статус {response.status_code}')
+        queries.append(len(context))
+    return {
+        'p50_ms': round(statistics.median(durations), 2),
+        'p90_ms': round(percentile(durations, 90), 2),
+        'p99_ms': round(percentile(durations, 99), 2),
+        'max_ms': round(max(durations), 2),
+        'queries': max(queries),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Список регрессий относительно сохранённых результатов."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if result['queries'] > previous['queries']:
+            regressions.append(
+                f"{name}: запросов {result['queries']} "
+                f"вместо {previous['queries']}")
+        if result['p50_ms'] > previous['p50_ms'] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p50 {result['p50_ms']} мс "
+                f"вместо {previous['p50_ms']} мс")
+    return regressions
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест API на синтетических данных во временной '
+            'тестовой базе данных.')
+
+    def add_arguments(self, parser):
+        for name, default in (
+            ('users', 200),
+            ('tags', 8),
+            ('ingredients', 2000),
+            ('recipes', 5000),
+            ('ingredients-per-recipe', 8),
+            ('favorites', 20000),
+            ('carts', 5000),
+            ('subscriptions', 2000),
+            ('repeat', 30),
+            ('seed', 1),
+        ):
+            parser.add_argument(f'--{name}', type=int, default=default)
+        parser.add_argument(
+            '--output', help='Файл для сохранения результатов (json).')
+        parser.add_argument(
+            '--baseline', help='Файл с результатами для сравнения (json).')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимое увеличение p50, доля (по умолчанию 0.2).')
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Не удалять тестовую базу данных.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)['results']
+        logging.getLogger('api.metrics').setLevel(logging.WARNING)
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, keepdb=options['keepdb'])
+        try:
+            results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+        report = {
+            'database': connection.vendor,
+            'options': {name: options[name] for name in (
+                'users', 'tags', 'ingredients', 'recipes',
+                'ingredients_per_recipe', 'favorites', 'carts',
+                'subscriptions', 'repeat', 'seed')},
+            'results': results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+        self.stdout.write(output)
+        if baseline is not None:
+            regressions = compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError(
+                    'Регрессии производительности:\n'
+                    + '\n'.join(regressions))
+            self.stdout.write('Регрессий нет')
+
+    def run(self, options):
+        started = time.monotonic()
+        user_ids, recipe_ids = seed(options)
+        self.stderr.write(
+            f'Данные созданы за {time.monotonic() - started:.1f} с')
+        for alias in caches:
+            caches[alias].clear()
+        user = User.objects.filter(
+            follower__isnull=False, shopping_carts__isnull=False
+        ).order_by('id').first() or User.objects.order_by('id').first()
+        token = Token.objects.create(user=user)
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        recipe_id = recipe_ids[len(recipe_ids) // 2]
+        # Ингредиенты рецепта без одного и несколько случайных.
+        pantry = list(IngredientInRecipe.objects.filter(
+            recipe_id=recipe_id).values_list('ingredient_id', flat=True))[1:]
+        pantry += random.Random(options['seed']).sample(
+            list(Ingredient.objects.values_list('id', flat=True)), 10)
+        results = {}
+        for name, url in SCENARIOS:
+            url = url.format(recipe_id=recipe_id,
+                             pantry=','.join(map(str, set(pantry))))
+            results[name] = measure(client, url, options['repeat'])
+            self.stderr.write(f'{name}: {results[name]}')
+        for count in FILTER_TAG_COUNTS:
+            if count > options['tags']:
+                continue
+            name = f'recipes_tags_{count}'
+            results[name] = measure(client, '/api/recipes/?' + '&'.join(
+                f'tags=tag{number}' for number in range(count)),
+                options['repeat'])
+            self.stderr.write(f'{name}: {results[name]}')
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        # Изображения обрабатываются в текущем потоке: фоновые задачи не
+        # должны пережить тестовую базу данных.
+        with override_settings(IMAGE_QUEUE='recipes.images.SyncImageQueue'):
+            # Сценарий называется по фактическому числу ингредиентов:
+            # --ingredients может быть меньше CREATE_RECIPE_INGREDIENTS.
+            counts = {min(count, len(ingredient_ids))
+                      for count in CREATE_RECIPE_INGREDIENTS} - {0}
+            for count in sorted(counts):
+                name = f'recipe_create_{count}'
+                results[name] = measure(
+                    client, '/api/recipes/', options['repeat'],
+                    data=recipe_payload(ingredient_ids[:count], tag_ids))
+                self.stderr.write(f'{name}: {results[name]}')
+        return results
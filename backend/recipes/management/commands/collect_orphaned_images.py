@@ -0,0 +1,76 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.images import VARIANTS_DIR
+from recipes.models import Recipe
+
+IMAGE_DIRS = (Recipe._meta.get_field('image').upload_to, VARIANTS_DIR)
+
+
+def count_references():
+    """Число рецептов, ссылающихся на каждый файл изображения."""
+    references = Counter()
+    recipes = Recipe.objects.exclude(image='').values_list(
+        'image', 'image_variants')
+    for name, variants in recipes.iterator():
+        references[name] += 1
+        for variant, formats in (variants or {}).items():
+            if variant != 'source':
+                references.update(set(formats.values()))
+    return references
+
+
+def list_files(storage, directory):
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield f'{directory}/{name}'
+    for name in directories:
+        yield from list_files(storage, f'{directory}/{name}')
+
+
+class Command(BaseCommand):
+    help = ('Удаляет файлы изображений рецептов, на которые не ссылается '
+            'ни один рецепт.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=3600,
+            help=('Не удалять файлы моложе указанного числа секунд '
+                  '(загрузки, которые ещё не сохранены в базе).')
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать файлы, которые будут удалены.'
+        )
+
+    def handle(self, *args, **options):
+        storage = Recipe._meta.get_field('image').storage
+        references = count_references()
+        deadline = timezone.now() - timedelta(seconds=options['grace'])
+        removed = kept = freed = 0
+        for directory in IMAGE_DIRS:
+            for name in list_files(storage, directory):
+                if references[name]:
+                    kept += 1
+                    continue
+                if storage.get_modified_time(name) > deadline:
+                    continue
+                freed += storage.size(name)
+                removed += 1
+                if options['dry_run']:
+                    self.stdout.write(name)
+                else:
+                    storage.delete(name)
+        shared = sum(1 for count in references.values() if count > 1)
+        self.stdout.write(
+            f'Используется файлов: {kept}, из них в нескольких рецептах: '
+            f'{shared}. {"Будет удалено" if options["dry_run"] else "Удалено"}'
+            f' файлов: {removed} ({freed} байт)')
@@ -1,38 +1,164 @@
-import os
+import csv
+import io
 import json
+import os
+import time
+from itertools import islice
+
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
 from recipes.models import Ingredient, Tag
+from recipes.versions import bump_table_version
 
+DATA_DIR = os.path.join(settings.BASE_DIR, 'data')
 
-def read_ingredients():
-    with open(os.path.join(settings.BASE_DIR, 'data', 'ingredients.json'),
-              'r', encoding='utf-8') as f:
-        data = json.load(f)
-        for i in range(len(data)):
-            Ingredient.objects.get_or_create(
-                name=data[i].get("name"),
-                measurement_unit=data[i].get("measurement_unit")
-            )
-    print('Данные из файла ingredients.json загружены')
-
-
-def read_tags():
-    with open(os.path.join(settings.BASE_DIR, 'data', 'tags.json'),
-              'r', encoding='utf-8') as f:
-        data = json.load(f)
-        for i in range(len(data)):
-            Tag.objects.get_or_create(
-                name=data[i].get("name"),
-                slug=data[i].get("slug"),
-                color=data[i].get("color")
+JSON_SEPARATORS = ' \t\r\n,[]'
+
+
+def read_json(path, chunk_size=64 * 1024):
+    """Построчное чтение массива объектов json без загрузки файла целиком."""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = ''
+        for chunk in iter(lambda: f.read(chunk_size), ''):
+            buffer += chunk
+            position = 0
+            while True:
+                while (position < len(buffer)
+                       and buffer[position] in JSON_SEPARATORS):
+                    position += 1
+                if position == len(buffer):
+                    break
+                try:
+                    item, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    break
+                yield item
+            buffer = buffer[position:]
+    if buffer.strip(JSON_SEPARATORS):
+        raise CommandError(f'Некорректный json в файле {path}')
+
+
+def read_csv(path, fields):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.reader(f):
+            yield dict(zip(fields, row))
+
+
+def read_rows(path, fields):
+    if os.path.splitext(path)[1] == '.csv':
+        return read_csv(path, fields)
+    return read_json(path)
+
+
+def batches(rows, batch_size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def bulk_load(model, rows, fields, batch_size):
+    """Пакетная вставка с пропуском уже существующих записей."""
+    before = model.objects.count()
+    total = 0
+    for batch in batches(rows, batch_size):
+        total += len(batch)
+        model.objects.bulk_create(
+            [model(**{field: row.get(field) for field in fields})
+             for row in batch],
+            ignore_conflicts=True
+        )
+    inserted = model.objects.count() - before
+    return inserted, total - inserted
+
+
+def copy_load(model, rows, fields, batch_size):
+    """Загрузка через COPY во временную таблицу (только PostgreSQL).
+
+    Внутри внешней транзакции ON COMMIT DROP не удаляет таблицу до её
+    конца, поэтому у каждой модели своя таблица и она удаляется сразу
+    после вставки.
+    """
+    table = model._meta.db_table
+    rows_table = f'load_data_{table}'
+    columns = ', '.join(fields)
+    total = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {rows_table}')
+        cursor.execute(
+            f'CREATE TEMP TABLE {rows_table} ON COMMIT DROP AS '
+            f'SELECT {columns} FROM {table} WITH NO DATA'
+        )
+        for batch in batches(rows, batch_size):
+            total += len(batch)
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerows(
+                [row.get(field) for field in fields] for row in batch)
+            buffer.seek(0)
+            cursor.copy_expert(
+                f'COPY {rows_table} ({columns}) FROM STDIN WITH CSV',
+                buffer
             )
-    print('Данные из файла tags.json загружены')
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) '
+            f'SELECT {columns} FROM {rows_table} '
+            f'ON CONFLICT DO NOTHING'
+        )
+        inserted = cursor.rowcount
+        cursor.execute(f'DROP TABLE {rows_table}')
+    return inserted, total - inserted
 
 
 class Command(BaseCommand):
+    help = 'Загружает ингредиенты и теги из файлов json или csv.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ingredients',
+            default=os.path.join(DATA_DIR, 'ingredients.json'),
+            help='Файл ингредиентов (.json или .csv).'
+        )
+        parser.add_argument(
+            '--tags',
+            default=os.path.join(DATA_DIR, 'tags.json'),
+            help='Файл тегов (.json или .csv).'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество строк в одном запросе.'
+        )
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='Загружать через COPY (только PostgreSQL).'
+        )
 
     def handle(self, *args, **options):
-        read_ingredients()
-        read_tags()
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше 0')
+        load = bulk_load
+        if options['copy']:
+            if connection.vendor != 'postgresql':
+                raise CommandError('--copy доступен только для PostgreSQL')
+            load = copy_load
+        for model, path, fields in (
+            (Ingredient, options['ingredients'],
+             ('name', 'measurement_unit')),
+            (Tag, options['tags'], ('name', 'slug', 'color')),
+        ):
+            started = time.monotonic()
+            inserted, skipped = load(
+                model, read_rows(path, fields), fields, options['batch_size'])
+            bump_table_version(model)
+            self.stdout.write(
+                f'Данные из файла {os.path.basename(path)} загружены: '
+                f'добавлено {inserted}, пропущено {skipped} '
+                f'за {time.monotonic() - started:.2f} с')
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import is_processed, process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Создаёт уменьшенные копии изображений рецептов, для которых '
+            'они ещё не созданы или не были созданы из-за ошибки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать копии для всех рецептов.'
+        )
+
+    def handle(self, *args, **options):
+        processed = 0
+        recipes = Recipe.objects.exclude(image='').values_list(
+            'id', 'image', 'image_variants').order_by('id')
+        for recipe_id, name, variants in recipes.iterator():
+            if not options['all'] and is_processed(variants, name):
+                continue
+            process_recipe_image(recipe_id, name)
+            processed += 1
+        self.stdout.write(f'Обработано изображений: {processed}')
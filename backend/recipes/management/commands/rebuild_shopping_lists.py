@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingListItem
+
+
+def find_mismatches():
+    expected = ShoppingListItem.objects.calculate()
+    actual = {
+        (item['user_id'], item['ingredient_id']): item['total']
+        for item in ShoppingListItem.objects.values(
+            'user_id', 'ingredient_id', 'total').iterator()
+    }
+    return {
+        key: (actual.get(key), expected.get(key))
+        for key in expected.keys() | actual.keys()
+        if actual.get(key) != expected.get(key)
+    }
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает списки покупок по корзинам пользователей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только проверить списки покупок, не изменяя их.'
+        )
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            count = ShoppingListItem.objects.rebuild()
+            self.stdout.write(f'Списки покупок пересчитаны: {count} строк')
+        mismatches = find_mismatches()
+        for (user_id, ingredient_id), (actual, expected) in sorted(
+                mismatches.items()):
+            self.stdout.write(
+                f'Пользователь {user_id}, ингредиент {ingredient_id}: '
+                f'{actual} вместо {expected}')
+        if mismatches:
+            raise CommandError(
+                f'Расхождений в списках покупок: {len(mismatches)}')
+        self.stdout.write('Списки покупок совпадают с корзинами')
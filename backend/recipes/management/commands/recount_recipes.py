@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+
+from recipes.models import (Favorite, IngredientInRecipe, Recipe,
+                            ShoppingCart, count_related)
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счётчики избранного и корзин рецептов с таблицами '
+            'Favorite и ShoppingCart, а копии числа ингредиентов и времени '
+            'приготовления в IngredientInRecipe — с рецептами, и '
+            'исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только проверить счётчики, не изменяя их.'
+        )
+
+    def handle(self, *args, **options):
+        mismatched = Recipe.objects.with_actual_counts().filter(
+            ~Q(favorites_count=F('actual_favorites_count'))
+            | ~Q(in_carts_count=F('actual_in_carts_count'))
+        )
+        count = mismatched.count()
+        stale = IngredientInRecipe.objects.stale()
+        stale_count = stale.count()
+        if options['verify']:
+            if count or stale_count:
+                raise CommandError(
+                    f'Расхождений в счётчиках: {count}, в ингредиентах '
+                    f'рецептов: {stale_count}')
+            self.stdout.write('Счётчики рецептов совпадают')
+            return
+        updated = Recipe.objects.filter(
+            pk__in=mismatched.values('pk')
+        ).update(
+            favorites_count=count_related(Favorite),
+            in_carts_count=count_related(ShoppingCart),
+        )
+        fixed = IngredientInRecipe.objects.filter(
+            recipe__in=stale.values('recipe')
+        ).update_recipe_fields()
+        self.stdout.write(f'Исправлены счётчики рецептов: {updated}, '
+                          f'строки ингредиентов рецептов: {fixed}')
@@ -0,0 +1,48 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes import recommendations
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает похожие рецепты по избранному. По умолчанию '
+            'учитывается только избранное, добавленное после прошлого '
+            'пересчёта.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать все рецепты (учитывает удаления из избранного).'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=settings.RECOMMENDATIONS_CHUNK_SIZE,
+            help='Строк избранного за одно чтение и рецептов в блоке.'
+        )
+        parser.add_argument(
+            '--pure-python',
+            action='store_true',
+            help='Не использовать NumPy и SciPy, даже если они установлены.'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        update = recommendations.update_similar_recipes(
+            full=options['full'],
+            chunk_size=options['chunk_size'],
+            use_scipy=not options['pure_python']
+        )
+        if update is None:
+            self.stdout.write('Нового избранного нет')
+            return
+        engine = recommendations.get_neighbours(
+            not options['pure_python']).__name__
+        self.stdout.write(
+            f'{"Полный" if update.full else "Частичный"} пересчёт '
+            f'({engine}) за {time.monotonic() - started:.1f} с: '
+            f'рецептов с похожими {update.recipes_count}, '
+            f'пар {update.neighbours_count}')
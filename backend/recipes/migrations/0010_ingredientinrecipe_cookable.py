@@ -0,0 +1,50 @@
+# Generated by Django 3.2 on 2026-10-18 18:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, OuterRef, Subquery
+
+
+def fill_recipe_fields(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    IngredientInRecipe.objects.update(
+        ingredients_count=Subquery(
+            IngredientInRecipe.objects.filter(
+                recipe=OuterRef('recipe')
+            ).order_by().values('recipe').annotate(
+                count=Count('pk')).values('count')
+        ),
+        cooking_time=Subquery(Recipe.objects.filter(
+            pk=OuterRef('recipe')).values('cooking_time'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredientinrecipe',
+            name='cooking_time',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Время приготовления рецепта'),
+        ),
+        migrations.AddField(
+            model_name='ingredientinrecipe',
+            name='ingredients_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Ингредиентов в рецепте'),
+        ),
+        migrations.RunPython(fill_recipe_fields, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ingredientinrecipe',
+            index=models.Index(fields=['ingredient', 'recipe'], include=('ingredients_count', 'cooking_time'), name='ingredient_recipe_idx'),
+        ),
+        migrations.AlterField(
+            model_name='ingredientinrecipe',
+            name='ingredient',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ingredients', to='recipes.ingredient', verbose_name='Ингредиент'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.2 on 2026-10-18 18:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_ingredientinrecipe_cookable'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarRecipesUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата пересчёта')),
+                ('last_favorite_id', models.PositiveBigIntegerField(verbose_name='Последняя учтённая строка избранного')),
+                ('full', models.BooleanField(verbose_name='Полный пересчёт')),
+                ('recipes_count', models.PositiveIntegerField(verbose_name='Рецептов с похожими')),
+                ('neighbours_count', models.PositiveIntegerField(verbose_name='Сохранено похожих рецептов')),
+            ],
+            options={
+                'verbose_name': 'Пересчёт похожих рецептов',
+                'verbose_name_plural': 'Пересчёты похожих рецептов',
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SimilarRecipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Оценка')),
+                ('recipe', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='similar_recipes', to='recipes.recipe', verbose_name='Рецепт')),
+                ('similar', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='similar_to', to='recipes.recipe', verbose_name='Похожий рецепт')),
+            ],
+            options={
+                'verbose_name': 'Похожий рецепт',
+                'verbose_name_plural': 'Похожие рецепты',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='similarrecipe',
+            index=models.Index(fields=['recipe', '-score'], include=('similar',), name='similar_recipe_score_idx'),
+        ),
+    ]
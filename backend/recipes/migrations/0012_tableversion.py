@@ -0,0 +1,37 @@
+# Generated by Django 3.2 on 2026-10-18 19:19
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def create_versions(apps, schema_editor):
+    TableVersion = apps.get_model('recipes', 'TableVersion')
+    now = timezone.now()
+    TableVersion.objects.bulk_create(
+        [TableVersion(table=table, version=1, modified=now)
+         for table in ('recipes.ingredient', 'recipes.tag')]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_similar_recipes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=100, unique=True, verbose_name='Таблица')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='Версия')),
+                ('modified', models.DateTimeField(verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Версия таблицы',
+                'verbose_name_plural': 'Версии таблиц',
+            },
+        ),
+        migrations.RunPython(create_versions, migrations.RunPython.noop),
+    ]
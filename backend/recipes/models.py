@@ -1,8 +1,18 @@
 from colorfield.fields import ColorField
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, SearchVectorField)
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import (Case, Count, Exists, ExpressionWrapper, F,
+                              FloatField, IntegerField, Max, OuterRef, Q,
+                              Subquery, Sum, Value, When, Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Coalesce, RowNumber
 
-from users.models import User
+from recipes.storage import content_storage
+from users.models import LinkQuerySet, Subscribe, User
 
 
 class Ingredient(models.Model):
@@ -58,6 +68,117 @@ class Tag(models.Model):
         return self.name
 
 
+POPULAR_ORDERING = ('-favorites_count', '-pub_date', '-id')
+
+SEARCH_ORDERING = ('-search_rank', '-pub_date', '-id')
+
+COOKABLE_ORDERING = ('missing_count', '-matched_count', '-recipe_id')
+
+
+def count_related(model):
+    """Подзапрос числа строк model, ссылающихся на рецепт."""
+    return Coalesce(Subquery(
+        model.objects.filter(recipe=OuterRef('pk')).order_by().values(
+            'recipe').annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов рецептов."""
+
+    def popular(self):
+        return self.order_by(*POPULAR_ORDERING)
+
+    def search(self, value):
+        """Полнотекстовый поиск по названию, описанию и ингредиентам.
+
+        В PostgreSQL использует search_vector и упорядочивает по SearchRank,
+        в остальных базах ищет каждое слово через icontains. SearchRank
+        (real) приводится к double precision: значение из курсора
+        постраничного вывода должно совпадать с ним при сравнении.
+        """
+        if connections[self.db].vendor == 'postgresql':
+            query = SearchQuery(value, config=settings.RECIPE_SEARCH_CONFIG,
+                                search_type='websearch')
+            return self.filter(search_vector=query).annotate(search_rank=Cast(
+                SearchRank(F('search_vector'), query), FloatField()
+            )).order_by(*SEARCH_ORDERING)
+        queryset = self
+        for word in value.split():
+            queryset = queryset.filter(
+                Q(name__icontains=word)
+                | Q(text__icontains=word)
+                | Exists(IngredientInRecipe.objects.filter(
+                    recipe=OuterRef('pk'), ingredient__name__icontains=word))
+            )
+        return queryset.annotate(search_rank=Case(
+            When(name__icontains=value, then=Value(1.0)),
+            default=Value(0.5),
+            output_field=FloatField()
+        )).order_by(*SEARCH_ORDERING)
+
+    def update_search_vector(self):
+        """Пересчёт search_vector (только PostgreSQL)."""
+        if connections[self.db].vendor != 'postgresql':
+            return 0
+        config = settings.RECIPE_SEARCH_CONFIG
+        ingredients = IngredientInRecipe.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config=config)
+            + SearchVector('text', weight='B', config=config)
+            + SearchVector(Coalesce(Subquery(ingredients), Value('')),
+                           weight='C', config=config)
+        ))
+
+    def similar_to(self, recipe_id):
+        """Похожие рецепты (SimilarRecipe) по убыванию оценки."""
+        return self.filter(similar_to__recipe=recipe_id).annotate(
+            similar_score=F('similar_to__score')).order_by('-similar_score')
+
+    def with_actual_counts(self):
+        """Фактическое число добавлений в избранное и в корзины."""
+        return self.annotate(
+            actual_favorites_count=count_related(Favorite),
+            actual_in_carts_count=count_related(ShoppingCart),
+        )
+
+    def with_user_flags(self, user):
+        """Отметки избранного, корзины и подписки на автора для user."""
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=models.BooleanField()),
+                is_in_shopping_cart=Value(
+                    False, output_field=models.BooleanField()),
+                author_is_subscribed=Value(
+                    False, output_field=models.BooleanField()),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            author_is_subscribed=Exists(Subscribe.objects.filter(
+                user=user, author=OuterRef('author'))),
+        )
+
+    def first_per_author(self, limit):
+        """Не более limit последних рецептов каждого автора одним запросом."""
+        ranked = self.annotate(recipe_rank=Window(
+            RowNumber(),
+            partition_by=F('author'),
+            order_by=F('pub_date').desc()
+        )).order_by().values('id', 'recipe_rank')
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(pk__in=RawSQL(
+            f'SELECT id FROM ({sql}) ranked WHERE recipe_rank <= %s',
+            (*params, limit)
+        ))
+
+
 class Recipe(models.Model):
     """Модель просмотра, создания, редактирования и удаления рецептов."""
     name = models.CharField(max_length=200)
@@ -78,7 +199,14 @@ class Recipe(models.Model):
         through_fields=('recipe', 'ingredient'),
         verbose_name='Ингредиенты',
     )
-    image = models.ImageField(upload_to='recipes/media')
+    image = models.ImageField(upload_to='recipes/media',
+                              storage=content_storage)
+    image_variants = models.JSONField(
+        verbose_name='Варианты изображения',
+        default=dict,
+        blank=True,
+        editable=False
+    )
     text = models.TextField(verbose_name='Описание')
     cooking_time = models.PositiveIntegerField(
         verbose_name='Время приготовления',
@@ -92,23 +220,125 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В корзинах',
+        default=0,
+        editable=False
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-pub_date', '-id'],
+                name='recipe_popular_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.author}'
 
 
+class IngredientInRecipeQuerySet(models.QuerySet):
+    """Набор запросов ингредиентов рецептов."""
+
+    def cookable(self, ingredient_ids, max_missing=None, cooking_time=None):
+        """Рецепты, в которых есть хотя бы один из ingredient_ids.
+
+        Возвращает словари с recipe_id, matched_count и missing_count. Строки
+        хранят число ингредиентов и время приготовления рецепта, поэтому
+        запрос читает только индекс ingredient_recipe_idx и не обращается
+        к таблице рецептов.
+        """
+        ingredient_ids = list(ingredient_ids)
+        queryset = self.filter(ingredient__in=ingredient_ids)
+        if cooking_time is not None:
+            queryset = queryset.filter(cooking_time__lte=cooking_time)
+        if max_missing is not None:
+            queryset = queryset.filter(
+                ingredients_count__lte=len(ingredient_ids) + max_missing)
+        queryset = queryset.values('recipe_id').annotate(
+            matched_count=Count('recipe'),
+            missing_count=ExpressionWrapper(
+                Max('ingredients_count') - Count('recipe'),
+                output_field=IntegerField()
+            )
+        )
+        if max_missing is not None:
+            queryset = queryset.filter(missing_count__lte=max_missing)
+        return queryset.order_by(*COOKABLE_ORDERING)
+
+    @staticmethod
+    def get_recipe_fields():
+        """Число ингредиентов и время приготовления рецепта строки."""
+        return {
+            'ingredients_count': Subquery(
+                IngredientInRecipe.objects.filter(
+                    recipe=OuterRef('recipe')
+                ).order_by().values('recipe').annotate(
+                    count=Count('pk')).values('count')
+            ),
+            'cooking_time': Subquery(Recipe.objects.filter(
+                pk=OuterRef('recipe')).values('cooking_time')),
+        }
+
+    def update_recipe_fields(self):
+        """Копирует в строки число ингредиентов и время приготовления
+        их рецептов."""
+        return self.update(**self.get_recipe_fields())
+
+    def set_recipe_fields(self, **values):
+        """Запись известных значений полей рецепта (ingredients_count,
+        cooking_time) только в строки, где они отличаются."""
+        differs = Q()
+        for field, value in values.items():
+            differs |= ~Q(**{field: value})
+        return self.filter(differs).update(**values)
+
+    def amounts(self):
+        """Суммарное количество ингредиентов: {id ингредиента: количество}."""
+        return dict(self.values('ingredient_id').annotate(
+            total=Sum('amount')).order_by().values_list(
+                'ingredient_id', 'total'))
+
+    def stale(self):
+        """Строки, в которых эти значения отличаются от рецепта."""
+        fields = self.get_recipe_fields()
+        return self.annotate(
+            actual_ingredients_count=fields['ingredients_count'],
+            actual_cooking_time=fields['cooking_time'],
+        ).filter(
+            ~Q(ingredients_count=F('actual_ingredients_count'))
+            | ~Q(cooking_time=F('actual_cooking_time'))
+        )
+
+
 class IngredientInRecipe(models.Model):
     """Модель для просмотра ингредиентов."""
     ingredient = models.ForeignKey(
         Ingredient,
         on_delete=models.CASCADE,
         related_name='ingredients',
-        verbose_name='Ингредиент'
+        verbose_name='Ингредиент',
+        db_index=False
     )
     amount = models.PositiveIntegerField(
         verbose_name='Количество',
@@ -125,6 +355,18 @@ class IngredientInRecipe(models.Model):
         verbose_name='Рецепт'
 
     )
+    ingredients_count = models.PositiveIntegerField(
+        verbose_name='Ингредиентов в рецепте',
+        default=0,
+        editable=False
+    )
+    cooking_time = models.PositiveIntegerField(
+        verbose_name='Время приготовления рецепта',
+        default=1,
+        editable=False
+    )
+
+    objects = IngredientInRecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Ингредиенты в рецепте'
@@ -135,6 +377,13 @@ class IngredientInRecipe(models.Model):
                 name='unique_ingredients'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['ingredient', 'recipe'],
+                include=['ingredients_count', 'cooking_time'],
+                name='ingredient_recipe_idx'
+            )
+        ]
 
     def __str__(self):
         return (f'{self.recipe.name}: '
@@ -143,6 +392,88 @@ class IngredientInRecipe(models.Model):
                 f'{self.ingredient.measurement_unit}')
 
 
+class UserRecipeQuerySet(LinkQuerySet):
+    """Рецепты пользователя, которые учитываются в счётчике рецепта."""
+    target_field = 'recipe'
+    counter_field = None
+
+    def get_related_sql(self, delta):
+        ops = connections[self.db].ops
+        table = ops.quote_name(Recipe._meta.db_table)
+        pk = ops.quote_name(Recipe._meta.pk.column)
+        counter = ops.quote_name(self.counter_field)
+        # Строки рецептов блокируются по порядку id: одновременные
+        # пакетные изменения не блокируют их навстречу друг другу.
+        return (f'UPDATE {table} SET {counter} = {counter} + {int(delta)} '
+                f'WHERE {pk} IN (SELECT {pk} FROM {table} '
+                f'WHERE {pk} IN (SELECT target_id FROM changed) '
+                f'ORDER BY {pk} FOR NO KEY UPDATE)')
+
+    def update_related(self, target_ids, delta):
+        Recipe.objects.filter(id__in=target_ids).update(
+            **{self.counter_field: F(self.counter_field) + delta})
+
+    def apply_change(self, user_id, recipe_id, sign):
+        """Учёт строки, добавленной (sign=1) или удалённой (sign=-1) через
+        ORM (recipes.signals): add и remove учитывают изменения сами."""
+        self.update_related([recipe_id], sign)
+
+    def remove_recipe(self, recipe):
+        """Удаление всех связей с рецептом (перед удалением рецепта).
+
+        Строки удаляются одним запросом без сигнала post_delete, который
+        иначе уменьшал бы счётчик удаляемого рецепта для каждой строки.
+        """
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self._table} '
+                f'WHERE {self._target_column} = %s', [recipe.pk])
+
+
+class FavoriteQuerySet(UserRecipeQuerySet):
+    counter_field = 'favorites_count'
+
+
+class ShoppingCartQuerySet(UserRecipeQuerySet):
+    """Рецепты в корзине: изменения сразу учитываются в списке покупок."""
+    counter_field = 'in_carts_count'
+
+    def add(self, user, recipe_ids):
+        with transaction.atomic(using=self.db):
+            added = super().add(user, recipe_ids)
+            ShoppingListItem.objects.apply_recipes(added, [user.id])
+        return added
+
+    def remove(self, user, recipe_ids):
+        with transaction.atomic(using=self.db):
+            removed = super().remove(user, recipe_ids)
+            ShoppingListItem.objects.apply_recipes(
+                removed, [user.id], sign=-1)
+        return removed
+
+    def apply_change(self, user_id, recipe_id, sign):
+        with transaction.atomic(using=self.db):
+            super().apply_change(user_id, recipe_id, sign)
+            ShoppingListItem.objects.apply_recipes(
+                [recipe_id], [user_id], sign=sign)
+
+    def remove_recipe(self, recipe):
+        """Списки покупок всех пользователей изменяются одним вызовом.
+
+        Строка рецепта блокируется, чтобы рецепт не добавили в корзину
+        в это время.
+        """
+        with transaction.atomic(using=self.db):
+            list(Recipe.objects.select_for_update().filter(
+                pk=recipe.pk).values_list('pk'))
+            ShoppingListItem.objects.apply_recipe(
+                recipe,
+                self.filter(recipe=recipe).values_list('user_id', flat=True),
+                sign=-1
+            )
+            super().remove_recipe(recipe)
+
+
 class Favorite(models.Model):
     """Модель для создания избранных рецептов."""
     user = models.ForeignKey(
@@ -158,6 +489,8 @@ class Favorite(models.Model):
         verbose_name='Избранный рецепт'
     )
 
+    objects = FavoriteQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
@@ -183,6 +516,8 @@ class ShoppingCart(models.Model):
         verbose_name='Рецепт в корзине'
     )
 
+    objects = ShoppingCartQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзина'
@@ -192,3 +527,244 @@ class ShoppingCart(models.Model):
                 name='unique_shopping_cart'
             )
         ]
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+    """Набор запросов списка покупок."""
+
+    def apply(self, user_ids, amounts):
+        """Изменение количества ингредиентов в списках покупок.
+
+        amounts — словарь {id ингредиента: изменение количества}.
+        """
+        amounts = {pk: delta for pk, delta in amounts.items() if delta}
+        user_ids = list(user_ids)
+        if not amounts or not user_ids:
+            return
+        with transaction.atomic():
+            # Одновременные изменения списка одного пользователя выполняются
+            # по очереди, иначе они могут создать одну и ту же строку.
+            self.lock_users(user_ids)
+            items = {
+                (item.user_id, item.ingredient_id): item
+                for item in self.select_for_update().filter(
+                    user_id__in=user_ids, ingredient_id__in=amounts)
+            }
+            created, changed, removed = [], [], []
+            for user_id in user_ids:
+                for ingredient_id, delta in amounts.items():
+                    item = items.get((user_id, ingredient_id))
+                    if item is None:
+                        if delta > 0:
+                            created.append(self.model(
+                                user_id=user_id,
+                                ingredient_id=ingredient_id,
+                                total=delta
+                            ))
+                        continue
+                    item.total += delta
+                    if item.total > 0:
+                        changed.append(item)
+                    else:
+                        removed.append(item.pk)
+            if removed:
+                self.filter(pk__in=removed).delete()
+            self.bulk_update(changed, ('total',))
+            self.bulk_create(created)
+
+    @staticmethod
+    def lock_users(user_ids=None):
+        """Блокировка пользователей (None — всех) до конца транзакции.
+
+        FOR NO KEY UPDATE не конфликтует с проверками внешних ключей при
+        добавлении в избранное, корзину и подписки этих же пользователей.
+        """
+        users = User.objects.select_for_update(no_key=True)
+        if user_ids is not None:
+            users = users.filter(pk__in=user_ids)
+        list(users.order_by('pk').values_list('pk'))
+
+    def apply_recipe(self, recipe, user_ids, sign=1):
+        """Добавление (sign=-1 — вычитание) ингредиентов рецепта."""
+        self.apply(user_ids, {
+            ingredient_id: sign * amount
+            for ingredient_id, amount in recipe.recipes.values_list(
+                'ingredient_id', 'amount')
+        })
+
+    def apply_recipes(self, recipe_ids, user_ids, sign=1):
+        """Как apply_recipe, но для нескольких рецептов сразу."""
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+        self.apply(user_ids, {
+            ingredient_id: sign * total
+            for ingredient_id, total in IngredientInRecipe.objects.filter(
+                recipe_id__in=recipe_ids).amounts().items()
+        })
+
+    def calculate(self, user_ids=None):
+        """Суммы ингредиентов в корзинах по данным рецептов.
+
+        Возвращает словарь {(id пользователя, id ингредиента): количество}.
+        """
+        lookup = {'recipe__shopping_carts__isnull': False}
+        if user_ids is not None:
+            lookup = {'recipe__shopping_carts__user__in': user_ids}
+        items = IngredientInRecipe.objects.filter(**lookup).values(
+            'recipe__shopping_carts__user', 'ingredient'
+        ).annotate(total=Sum('amount')).order_by()
+        return {
+            (item['recipe__shopping_carts__user'], item['ingredient']):
+                item['total']
+            for item in items.iterator()
+        }
+
+    def rebuild(self, user_ids=None):
+        """Пересчёт списков покупок с нуля.
+
+        Суммы считаются после блокировки пользователей: изменения корзин,
+        которые ждут блокировки в apply, учитываются после пересчёта.
+        """
+        with transaction.atomic():
+            self.lock_users(user_ids)
+            totals = self.calculate(user_ids)
+            items = self.all()
+            if user_ids is not None:
+                items = items.filter(user_id__in=user_ids)
+            items.delete()
+            self.bulk_create(
+                [self.model(user_id=user_id,
+                            ingredient_id=ingredient_id,
+                            total=total)
+                 for (user_id, ingredient_id), total in totals.items()],
+                batch_size=1000
+            )
+        return len(totals)
+
+
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента по всем рецептам в корзине пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    total = models.PositiveIntegerField(verbose_name='Количество')
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Список покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-total'],
+                name='shopping_list_user_total_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.total}'
+
+
+class SimilarRecipe(models.Model):
+    """Рецепт, который часто добавляют в избранное вместе с данным.
+
+    Строки — производные данные команды update_similar_recipes, поэтому
+    внешние ключи не проверяются базой: строки удалённых рецептов не видны
+    при чтении (соединение с рецептами) и удаляются при полном пересчёте.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        db_index=False,
+        db_constraint=False,
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.DO_NOTHING,
+        related_name='similar_to',
+        db_index=False,
+        db_constraint=False,
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField(verbose_name='Оценка')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'],
+                include=['similar'],
+                name='similar_recipe_score_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id} -> {self.similar_id}: {self.score:.3f}'
+
+
+class SimilarRecipesUpdate(models.Model):
+    """Пересчёт похожих рецептов командой update_similar_recipes."""
+    created = models.DateTimeField(
+        verbose_name='Дата пересчёта',
+        auto_now_add=True
+    )
+    last_favorite_id = models.PositiveBigIntegerField(
+        verbose_name='Последняя учтённая строка избранного'
+    )
+    full = models.BooleanField(verbose_name='Полный пересчёт')
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Рецептов с похожими')
+    neighbours_count = models.PositiveIntegerField(
+        verbose_name='Сохранено похожих рецептов')
+
+    class Meta:
+        ordering = ['-id']
+        verbose_name = 'Пересчёт похожих рецептов'
+        verbose_name_plural = 'Пересчёты похожих рецептов'
+
+    def __str__(self):
+        return f'{self.created:%Y-%m-%d %H:%M}: {self.recipes_count}'
+
+
+class TableVersion(models.Model):
+    """Номер и время последнего изменения таблицы справочника.
+
+    Общие для всех процессов: по ним строятся ETag, Last-Modified и ключи
+    кеша ответов.
+    """
+    table = models.CharField(
+        verbose_name='Таблица',
+        max_length=100,
+        unique=True
+    )
+    version = models.PositiveBigIntegerField(
+        verbose_name='Версия',
+        default=0
+    )
+    modified = models.DateTimeField(verbose_name='Дата изменения')
+
+    class Meta:
+        verbose_name = 'Версия таблицы'
+        verbose_name_plural = 'Версии таблиц'
+
+    def __str__(self):
+        return f'{self.table}: {self.version}'
@@ -0,0 +1,182 @@
+import heapq
+import math
+from collections import Counter, defaultdict
+from itertools import chain, groupby, islice
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from recipes.models import (Favorite, Recipe, SimilarRecipe,
+                            SimilarRecipesUpdate)
+
+try:
+    import numpy
+    from scipy import sparse
+except ImportError:
+    numpy = sparse = None
+
+
+def load_baskets(favorites, chunk_size):
+    """Списки избранных рецептов: {id пользователя: [id рецептов]}.
+
+    Избранное читается курсором по chunk_size строк в порядке индекса
+    (user, recipe). Пользователи с одним рецептом и с числом рецептов больше
+    RECOMMENDATIONS_MAX_USER_FAVORITES пропускаются: первые не дают пар,
+    у вторых число пар растёт квадратично, а сигнал слабый.
+    """
+    rows = favorites.order_by('user_id', 'recipe_id').values_list(
+        'user_id', 'recipe_id').iterator(chunk_size=chunk_size)
+    baskets = {}
+    for user_id, items in groupby(rows, key=itemgetter(0)):
+        basket = [recipe_id for _, recipe_id in items]
+        if 1 < len(basket) <= settings.RECOMMENDATIONS_MAX_USER_FAVORITES:
+            baskets[user_id] = basket
+    return baskets
+
+
+def python_neighbours(baskets, rows, totals, chunk_size):
+    """Похожие рецепты без NumPy: счётчики пар строятся по одной строке."""
+    top_k = settings.RECOMMENDATIONS_TOP_K
+    min_count = settings.RECOMMENDATIONS_MIN_COUNT
+    users = defaultdict(list)
+    for user_id, basket in baskets.items():
+        for recipe_id in basket:
+            if rows is None or recipe_id in rows:
+                users[recipe_id].append(user_id)
+    for recipe_id in sorted(users):
+        total = totals.get(recipe_id)
+        if not total:
+            continue
+        counts = Counter()
+        for user_id in users[recipe_id]:
+            counts.update(baskets[user_id])
+        del counts[recipe_id]
+        best = heapq.nlargest(top_k, (
+            (count / math.sqrt(total * totals[other]), other)
+            for other, count in counts.items()
+            if count >= min_count and totals.get(other)
+        ))
+        yield recipe_id, [(other, score) for score, other in best]
+
+
+def sparse_neighbours(baskets, rows, totals, chunk_size):
+    """Похожие рецепты на разреженных матрицах SciPy.
+
+    X — матрица «пользователи × рецепты»; строки X.T @ X считаются блоками
+    по chunk_size рецептов, поэтому в памяти не бывает всей матрицы пар.
+    """
+    top_k = settings.RECOMMENDATIONS_TOP_K
+    min_count = settings.RECOMMENDATIONS_MIN_COUNT
+    indices = numpy.fromiter(chain.from_iterable(baskets.values()),
+                             dtype=numpy.int64)
+    if not len(indices):
+        return
+    indptr = numpy.zeros(len(baskets) + 1, dtype=numpy.int64)
+    numpy.cumsum([len(basket) for basket in baskets.values()],
+                 out=indptr[1:])
+    size = max(int(indices.max()), max(totals, default=0)) + 1
+    users = sparse.csr_matrix(
+        (numpy.ones(len(indices), dtype=numpy.int32), indices, indptr),
+        shape=(len(baskets), size)
+    )
+    recipes = users.T.tocsr()
+    totals_array = numpy.zeros(size, dtype=numpy.float64)
+    totals_array[list(totals)] = list(totals.values())
+    row_ids = numpy.flatnonzero(numpy.diff(recipes.indptr))
+    if rows is not None:
+        row_ids = row_ids[numpy.isin(row_ids, list(rows))]
+    for start in range(0, len(row_ids), chunk_size):
+        block = row_ids[start:start + chunk_size]
+        product = (recipes[block] @ users).tocsr()
+        for position, recipe_id in enumerate(block.tolist()):
+            begin, end = product.indptr[position:position + 2]
+            others = product.indices[begin:end]
+            counts = product.data[begin:end]
+            mask = ((counts >= min_count) & (others != recipe_id)
+                    & (totals_array[others] > 0))
+            if not totals_array[recipe_id] or not mask.any():
+                continue
+            others, counts = others[mask], counts[mask]
+            scores = counts / numpy.sqrt(
+                totals_array[recipe_id] * totals_array[others])
+            if len(scores) > top_k:
+                best = numpy.argpartition(-scores, top_k)[:top_k]
+                others, scores = others[best], scores[best]
+            order = numpy.argsort(-scores, kind='stable')
+            yield recipe_id, list(zip(others[order].tolist(),
+                                      scores[order].tolist()))
+
+
+def get_neighbours(use_scipy=True):
+    """sparse_neighbours, если установлены NumPy и SciPy."""
+    if use_scipy and sparse is not None:
+        return sparse_neighbours
+    return python_neighbours
+
+
+def chunks(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def update_similar_recipes(full=False, chunk_size=None, use_scipy=True):
+    """Пересчёт похожих рецептов по избранному.
+
+    Оценка пары — косинусная мера count / sqrt(n_a * n_b), где count —
+    число пользователей, добавивших в избранное оба рецепта, n — число
+    добавлений рецепта в избранное. Для каждого рецепта сохраняются
+    RECOMMENDATIONS_TOP_K лучших пар, встретившихся не меньше
+    RECOMMENDATIONS_MIN_COUNT раз.
+
+    Без full пересчитываются только строки рецептов из списков избранного
+    пользователей, добавивших что-то после прошлого пересчёта: только в
+    этих строках могли измениться счётчики пар. Удаления из избранного и
+    изменение n у соседей других рецептов учитывает полный пересчёт.
+    Возвращает запись SimilarRecipesUpdate или None, если нового
+    избранного нет.
+    """
+    chunk_size = chunk_size or settings.RECOMMENDATIONS_CHUNK_SIZE
+    last_update = SimilarRecipesUpdate.objects.first()
+    last_favorite_id = Favorite.objects.aggregate(
+        Max('id'))['id__max'] or 0
+    favorites = Favorite.objects.filter(id__lte=last_favorite_id)
+    full = full or last_update is None
+    rows = stale = None
+    if not full:
+        if last_favorite_id <= last_update.last_favorite_id:
+            return None
+        affected = favorites.filter(user__in=favorites.filter(
+            id__gt=last_update.last_favorite_id).values('user_id')
+        ).values('recipe_id')
+        rows = set(affected.values_list('recipe_id', flat=True))
+        stale = SimilarRecipe.objects.filter(recipe__in=affected)
+        favorites = favorites.filter(user__in=favorites.filter(
+            recipe__in=affected).values('user_id'))
+    baskets = load_baskets(favorites, chunk_size)
+    totals = dict(Recipe.objects.filter(favorites_count__gt=0).values_list(
+        'id', 'favorites_count').iterator(chunk_size=chunk_size))
+    neighbours = get_neighbours(use_scipy)(
+        baskets, rows, totals, chunk_size)
+    recipes_count = saved = 0
+    with transaction.atomic():
+        (stale if stale is not None else SimilarRecipe.objects.all()).delete()
+        for batch in chunks(neighbours, 1000):
+            objs = [SimilarRecipe(recipe_id=recipe_id, similar_id=other,
+                                  score=score)
+                    for recipe_id, similar in batch
+                    for other, score in similar]
+            SimilarRecipe.objects.bulk_create(objs)
+            recipes_count += sum(1 for _, similar in batch if similar)
+            saved += len(objs)
+        return SimilarRecipesUpdate.objects.create(
+            last_favorite_id=last_favorite_id,
+            full=full,
+            recipes_count=recipes_count,
+            neighbours_count=saved
+        )
@@ -0,0 +1,80 @@
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from recipes.autocomplete import ingredient_index
+from recipes.images import schedule_recipe_image
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, Tag)
+from recipes.versions import bump_table_version
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Ingredient)
+def update_recipe_search_vector(instance, created, **kwargs):
+    if not created:
+        Recipe.objects.filter(ingredients=instance).update_search_vector()
+
+
+@receiver(pre_delete, sender=Ingredient)
+def remember_ingredient_recipes(instance, **kwargs):
+    instance._recipe_ids = list(IngredientInRecipe.objects.filter(
+        ingredient=instance).values_list('recipe_id', flat=True))
+
+
+@receiver(post_delete, sender=Ingredient)
+def update_ingredient_recipes(instance, **kwargs):
+    """Каскадное удаление строк ингредиента изменяет число ингредиентов
+    рецептов, скопированное в IngredientInRecipe, и их поисковый вектор."""
+    recipe_ids = instance.__dict__.pop('_recipe_ids', None)
+    if recipe_ids:
+        IngredientInRecipe.objects.filter(
+            recipe__in=recipe_ids).update_recipe_fields()
+        Recipe.objects.filter(pk__in=recipe_ids).update_search_vector()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def bump_reference_version(sender, **kwargs):
+    bump_table_version(sender)
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_image_processing(instance, **kwargs):
+    schedule_recipe_image(instance)
+
+
+@receiver(pre_save, sender=Favorite)
+@receiver(pre_save, sender=ShoppingCart)
+def remember_link(sender, instance, **kwargs):
+    """Пользователь и рецепт сохраняемой строки до изменения."""
+    instance._saved_link = sender.objects.filter(
+        pk=instance.pk).values_list('user_id', 'recipe_id').first(
+    ) if instance.pk is not None else None
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def apply_saved_link(sender, instance, **kwargs):
+    """Добавление и изменение строки через ORM: админка, фикстуры."""
+    previous = instance.__dict__.pop('_saved_link', None)
+    if previous == (instance.user_id, instance.recipe_id):
+        return
+    if previous is not None:
+        sender.objects.apply_change(*previous, sign=-1)
+    sender.objects.apply_change(instance.user_id, instance.recipe_id, sign=1)
+
+
+@receiver(pre_delete, sender=Favorite)
+@receiver(pre_delete, sender=ShoppingCart)
+def apply_deleted_link(sender, instance, **kwargs):
+    """Удаление строки через ORM: админка, удаление пользователя.
+
+    pre_delete: при каскадном удалении ингредиенты рецепта, которые
+    вычитаются из списка покупок, ещё не удалены.
+    """
+    sender.objects.apply_change(instance.user_id, instance.recipe_id, sign=-1)
@@ -0,0 +1,40 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла — хеш sha256 его содержимого.
+
+    Повторная загрузка того же файла не записывает его заново, а
+    возвращает имя уже сохранённого. Файлы не удаляются вместе с
+    рецептами, так как могут использоваться несколькими из них; файлы
+    без ссылок удаляет команда collect_orphaned_images.
+    """
+
+    @staticmethod
+    def get_digest(content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        return digest.hexdigest()
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        directory, filename = posixpath.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        name = posixpath.join(
+            directory, f'{self.get_digest(content)}{extension}')
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+
+content_storage = ContentAddressedStorage()
@@ -0,0 +1,30 @@
+from recipes.models import Tag
+from recipes.versions import get_table_version
+
+
+class TagCache:
+    """Соответствие слагов тегов их id в памяти процесса.
+
+    Перечитывается из базы при изменении версии таблицы тегов.
+    """
+
+    def __init__(self):
+        self._version = None
+        self._ids = {}
+
+    def get_ids_by_slug(self):
+        version = get_table_version(Tag)
+        if version != self._version:
+            self._ids = dict(Tag.objects.values_list('slug', 'id'))
+            self._version = version
+        return self._ids
+
+    def get_choices(self):
+        return [(slug, slug) for slug in self.get_ids_by_slug()]
+
+    def get_ids(self, slugs):
+        ids = self.get_ids_by_slug()
+        return [ids[slug] for slug in slugs if slug in ids]
+
+
+tag_cache = TagCache()
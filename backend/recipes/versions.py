@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from recipes.models import TableVersion
+
+
+def get_version_key(model):
+    return f'table-version:{model._meta.label_lower}'
+
+
+def get_table_version(model):
+    """Версия таблицы: (номер изменения, время изменения или None).
+
+    Версия хранится в базе данных (TableVersion), поэтому одинакова во всех
+    процессах и не меняется без изменения таблицы. Кеш Django избавляет от
+    запроса к базе; в других процессах с локальным кешем новая версия
+    видна не позже чем через TABLE_VERSION_TIMEOUT секунд.
+    """
+    key = get_version_key(model)
+    version = cache.get(key)
+    if version is None:
+        version = TableVersion.objects.filter(
+            table=model._meta.label_lower
+        ).values_list('version', 'modified').first() or (0, None)
+        cache.set(key, version, settings.TABLE_VERSION_TIMEOUT)
+    return version
+
+
+def get_version_tag(model):
+    """Версия таблицы одной строкой для ETag и ключей кеша."""
+    version, modified = get_table_version(model)
+    timestamp = int(modified.timestamp()) if modified else 0
+    return f'{version:x}.{timestamp:x}'
+
+
+def bump_table_version(model):
+    """Увеличивает версию таблицы; кеш очищается после фиксации транзакции.
+    """
+    table = model._meta.label_lower
+    now = timezone.now()
+    if not TableVersion.objects.filter(table=table).update(
+            version=F('version') + 1, modified=now):
+        TableVersion.objects.get_or_create(
+            table=table, defaults={'version': 1, 'modified': now})
+    transaction.on_commit(lambda: cache.delete(get_version_key(model)))
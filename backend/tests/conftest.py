@@ -0,0 +1,80 @@
+import pytest
+from rest_framework.test import APIClient
+
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag,
+                            count_related)
+
+
+@pytest.fixture
+def user(django_user_model):
+    return django_user_model.objects.create_user(
+        username='user', email='user@example.com', password='password')
+
+
+@pytest.fixture
+def author(django_user_model):
+    return django_user_model.objects.create_user(
+        username='author', email='author@example.com', password='password')
+
+
+@pytest.fixture
+def anon_client():
+    return APIClient()
+
+
+@pytest.fixture
+def user_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def ingredients():
+    return Ingredient.objects.bulk_create(
+        [Ingredient(name=f'ingredient{number}', measurement_unit='г')
+         for number in range(300)])
+
+
+@pytest.fixture
+def tags():
+    return Tag.objects.bulk_create(
+        [Tag(name=f'Тег {number}', slug=f'tag{number}',
+             color=f'#{number:06X}')
+         for number in range(8)])
+
+
+def create_recipes(authors, tags, ingredients, count, per_recipe=3):
+    """Рецепты с тегами и ингредиентами без загрузки изображений."""
+    Recipe.objects.bulk_create(
+        [Recipe(author=authors[number % len(authors)],
+                name=f'Рецепт {number}', text='Описание',
+                image='recipes/media/test.jpg', cooking_time=number % 60 + 1)
+         for number in range(count)])
+    recipes = list(Recipe.objects.order_by('id'))
+    Recipe.tags.through.objects.bulk_create(
+        [Recipe.tags.through(recipe_id=recipe.id,
+                             tag_id=tags[number % len(tags)].id)
+         for number, recipe in enumerate(recipes)])
+    IngredientInRecipe.objects.bulk_create(
+        [IngredientInRecipe(
+            recipe=recipe,
+            ingredient=ingredients[(number + shift) % len(ingredients)],
+            amount=shift + 1, ingredients_count=per_recipe,
+            cooking_time=recipe.cooking_time)
+         for number, recipe in enumerate(recipes)
+         for shift in range(per_recipe)])
+    return recipes
+
+
+@pytest.fixture
+def recipes(author, user, tags, ingredients):
+    recipes = create_recipes([author, user], tags, ingredients, 20)
+    for recipe in recipes[::3]:
+        Favorite.objects.create(user=user, recipe=recipe)
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+    Recipe.objects.update(favorites_count=count_related(Favorite),
+                          in_carts_count=count_related(ShoppingCart))
+    ShoppingListItem.objects.rebuild()
+    return recipes
@@ -0,0 +1,53 @@
+import random
+
+import pytest
+
+from recipes.autocomplete import IngredientIndex
+
+NAMES = ['соль', 'соль морская', 'морская капуста', 'капуста', 'пассата',
+         'сахар', 'сахарная пудра', 'ванильный сахар', 'ааа', 'баааб',
+         'Абрикос', 'абрикосовый джем', 'джем']
+
+
+def brute_force(names, query, limit):
+    """Поиск полным просмотром, как до индекса подстрок."""
+    query = query.lower()
+    keys = sorted(names, key=str.lower)
+    prefix = [name for name in keys if name.lower().startswith(query)]
+    contains = [name for name in keys
+                if query in name.lower()
+                and not name.lower().startswith(query)]
+    return (prefix + contains)[:limit]
+
+
+@pytest.fixture
+def index():
+    index = IngredientIndex()
+    index._index = index.build(
+        (pk, name, 'г') for pk, name in enumerate(NAMES))
+    return index
+
+
+@pytest.mark.parametrize('query', (
+    '', 'с', 'са', 'сах', 'сахар', 'ар', 'хар', 'ахарн', 'аа', 'ааа', 'аааб',
+    'кап', 'уста', 'морс', 'АБР', 'джем', 'нет', 'ь м',
+))
+@pytest.mark.parametrize('limit', (1, 3, 50))
+def test_search_matches_full_scan(index, query, limit):
+    assert [item['name'] for item in index.search(query, limit)] == (
+        brute_force(NAMES, query, limit))
+
+
+def test_search_random_catalogue():
+    rng = random.Random(1)
+    names = list({''.join(rng.choice('абвгд ') for _ in range(
+        rng.randint(1, 12))) for _ in range(2000)})
+    index = IngredientIndex()
+    index._index = index.build(
+        (pk, name, 'г') for pk, name in enumerate(names))
+    for _ in range(300):
+        name = rng.choice(names)
+        start = rng.randrange(len(name))
+        query = name[start:start + rng.randint(1, 6)]
+        assert [item['name'] for item in index.search(query, 10)] == (
+            brute_force(names, query, 10))
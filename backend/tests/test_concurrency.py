@@ -0,0 +1,70 @@
+import random
+import threading
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from rest_framework.test import APIClient
+
+from recipes.models import Favorite, ShoppingCart
+
+THREADS = 8
+ITERATIONS = 25
+
+
+def toggle_urls(recipes, authors):
+    """Адреса одиночных и пакетных переключений с данными запросов."""
+    urls = []
+    for recipe in recipes:
+        urls.append((f'/api/recipes/{recipe.id}/favorite/', None))
+        urls.append((f'/api/recipes/{recipe.id}/shopping_cart/', None))
+    for author in authors:
+        urls.append((f'/api/users/{author.id}/subscribe/', None))
+    ids = {'ids': [recipe.id for recipe in recipes]}
+    urls.append(('/api/recipes/favorite/', ids))
+    urls.append(('/api/recipes/shopping_cart/', ids))
+    urls.append(('/api/users/subscribe/',
+                 {'ids': [author.id for author in authors]}))
+    return urls
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_toggles(django_user_model, recipes, author):
+    users = [django_user_model.objects.create_user(
+        username=f'stress{number}', email=f'stress{number}@example.com',
+        password='password') for number in range(THREADS // 2)]
+    # Несколько потоков на пользователя и немного рецептов: запросы
+    # сталкиваются на одних и тех же строках.
+    urls = toggle_urls(recipes[:3], [author, users[0]])
+    barrier = threading.Barrier(THREADS)
+    statuses = []
+    errors = []
+
+    def worker(number):
+        client = APIClient()
+        client.force_authenticate(users[number % len(users)])
+        rng = random.Random(number)
+        try:
+            barrier.wait()
+            for _ in range(ITERATIONS):
+                url, data = rng.choice(urls)
+                method = rng.choice((client.post, client.delete))
+                statuses.append(method(url, data, format='json').status_code)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(number,))
+               for number in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(statuses) == THREADS * ITERATIONS
+    assert not [code for code in statuses if code >= 500]
+    assert Favorite.objects.exists() or ShoppingCart.objects.exists()
+    call_command('recount_recipes', '--verify')
+    call_command('rebuild_shopping_lists', '--verify')
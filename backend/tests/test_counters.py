@@ -0,0 +1,91 @@
+import pytest
+from django.core.management import call_command
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def links(recipes, user, author):
+    """Рецепты в избранном и корзинах обоих пользователей."""
+    for recipe in recipes[:4]:
+        for model in (Favorite, ShoppingCart):
+            model.objects.get_or_create(user=user, recipe=recipe)
+            model.objects.get_or_create(user=author, recipe=recipe)
+    return recipes[:4]
+
+
+def assert_counters_match():
+    call_command('recount_recipes', '--verify')
+
+
+@pytest.mark.parametrize('model_name', ('favorite', 'shoppingcart'))
+def test_admin_change_and_delete(admin_client, links, recipes, author,
+                                 model_name):
+    obj = Favorite.objects.filter(user=author).first()
+    if model_name == 'shoppingcart':
+        obj = ShoppingCart.objects.filter(user=author).first()
+    url = f'/admin/recipes/{model_name}/{obj.id}/'
+    response = admin_client.post(
+        f'{url}change/', {'user': author.id, 'recipe': recipes[10].id})
+    assert response.status_code == 302
+    assert_counters_match()
+    response = admin_client.post(f'{url}delete/', {'post': 'yes'})
+    assert response.status_code == 302
+    assert_counters_match()
+
+
+def test_admin_list_editable(admin_client, links, recipes, user):
+    favorites = list(Favorite.objects.filter(user=user).order_by('-id')[:2])
+    data = {
+        'form-TOTAL_FORMS': len(favorites),
+        'form-INITIAL_FORMS': len(favorites),
+        '_save': 'Save',
+    }
+    for number, favorite in enumerate(favorites):
+        data[f'form-{number}-id'] = favorite.id
+        data[f'form-{number}-user'] = user.id
+        data[f'form-{number}-recipe'] = recipes[13 + number].id
+    response = admin_client.post('/admin/recipes/favorite/', data)
+    assert response.status_code == 302, response.context['cl'].formset.errors
+    assert Favorite.objects.filter(
+        recipe__in=recipes[13:15], user=user).count() == 2
+    assert_counters_match()
+
+
+@pytest.mark.parametrize('model', (Favorite, ShoppingCart))
+def test_orm_create_change_delete(recipes, author, model):
+    # Без пересчёта между изменениями: счётчики меняют только сигналы.
+    obj = model.objects.create(user=author, recipe=recipes[1])
+    assert_counters_match()
+    obj.recipe = recipes[2]
+    obj.save()
+    assert_counters_match()
+    obj.save()
+    assert_counters_match()
+    obj.delete()
+    assert_counters_match()
+
+
+def test_user_delete(user, links):
+    # Удаляются избранное и корзина пользователя и его рецепты.
+    user.delete()
+    assert_counters_match()
+
+
+def test_orm_delete(links, user):
+    Favorite.objects.filter(user=user).delete()
+    ShoppingCart.objects.filter(recipe=links[0]).delete()
+    assert_counters_match()
+
+
+def test_api_recipe_delete(links, user_client, user,
+                           django_assert_max_num_queries):
+    recipe = next(recipe for recipe in links if recipe.author == user)
+    # Связи с рецептом удаляются одним запросом, а не по строке.
+    with django_assert_max_num_queries(25):
+        response = user_client.delete(f'/api/recipes/{recipe.id}/')
+    assert response.status_code == 204
+    assert not Recipe.objects.filter(pk=recipe.id).exists()
+    assert_counters_match()
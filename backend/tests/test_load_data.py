@@ -0,0 +1,42 @@
+import json
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+
+from recipes.models import Ingredient, Tag
+
+pytestmark = pytest.mark.django_db
+
+TAGS = [
+    {'name': 'Завтрак', 'slug': 'breakfast', 'color': '#E26C2D'},
+    {'name': 'Обед', 'slug': 'lunch', 'color': '#49B64E'},
+]
+
+
+@pytest.fixture
+def files(tmp_path):
+    ingredients = tmp_path / 'ingredients.csv'
+    ingredients.write_text(
+        'абрикосовое варенье,г\nабрикосовое пюре,г\nсоль,по вкусу\n',
+        encoding='utf-8')
+    tags = tmp_path / 'tags.json'
+    tags.write_text(json.dumps(TAGS, ensure_ascii=False), encoding='utf-8')
+    return ['--ingredients', str(ingredients), '--tags', str(tags)]
+
+
+@pytest.mark.parametrize('copy', (
+    False,
+    pytest.param(True, marks=pytest.mark.skipif(
+        connection.vendor != 'postgresql',
+        reason='COPY есть только в PostgreSQL')),
+))
+def test_load_data(files, copy):
+    # Обе модели загружаются в одной внешней транзакции (тестовой), второй
+    # запуск пропускает существующие строки.
+    args = files + (['--copy'] if copy else [])
+    for _ in range(2):
+        call_command('load_data', *args, '--batch-size', '2')
+        assert Ingredient.objects.count() == 3
+        assert set(Tag.objects.values_list('slug', flat=True)) == {
+            'breakfast', 'lunch'}
@@ -0,0 +1,18 @@
+import pytest
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.mark.parametrize('method, url', (
+    ('get', '/api/recipes/abc/'),
+    ('get', '/api/recipes/abc/similar/'),
+    ('post', '/api/recipes/abc/favorite/'),
+    ('delete', '/api/recipes/abc/favorite/'),
+    ('post', '/api/recipes/abc/shopping_cart/'),
+    ('delete', '/api/recipes/abc/shopping_cart/'),
+    ('get', '/api/users/abc/'),
+    ('post', '/api/users/abc/subscribe/'),
+    ('delete', '/api/users/abc/subscribe/'),
+))
+def test_non_numeric_id(user_client, method, url):
+    assert getattr(user_client, method)(url).status_code == 404
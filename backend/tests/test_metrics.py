@@ -0,0 +1,40 @@
+import json
+import logging
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api.middleware import QueryBudgetExceeded
+
+pytestmark = pytest.mark.django_db
+
+
+def logged_metrics(caplog):
+    return [json.loads(record.getMessage()) for record in caplog.records
+            if record.name == 'api.metrics'
+            and record.levelno == logging.INFO]
+
+
+def test_streaming_response_queries(user_client, recipes, caplog):
+    caplog.set_level(logging.INFO, logger='api.metrics')
+    with CaptureQueriesContext(connection) as context:
+        response = user_client.get(
+            '/api/recipes/download_shopping_cart/?format=csv')
+        assert response.streaming
+        # Метрики пишутся, когда тело прочитано.
+        assert not logged_metrics(caplog)
+        content = b''.join(response.streaming_content)
+    [metrics] = logged_metrics(caplog)
+    assert metrics['endpoint'] == 'RecipeViewSet.download_shopping_cart'
+    assert metrics['queries'] == len(context.captured_queries)
+    assert metrics['response_bytes'] == len(content) > 0
+
+
+def test_streaming_response_budget(user_client, recipes, settings):
+    settings.QUERY_BUDGET_RAISE = True
+    settings.QUERY_BUDGETS = {'RecipeViewSet.download_shopping_cart': 0}
+    response = user_client.get(
+        '/api/recipes/download_shopping_cart/?format=csv')
+    with pytest.raises(QueryBudgetExceeded, match='download_shopping_cart'):
+        b''.join(response.streaming_content)
@@ -0,0 +1,47 @@
+import datetime
+from urllib.parse import quote
+
+import pytest
+from django.db import connection
+from django.utils import timezone
+
+from recipes.models import Recipe
+
+pytestmark = pytest.mark.django_db
+
+
+def collect_pages(client, url):
+    """id рецептов со всех страниц, по ссылкам next."""
+    ids = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        ids += [recipe['id'] for recipe in response.data['results']]
+        assert len(ids) == len(set(ids)), 'Рецепты на страницах повторяются'
+        url = response.data['next']
+    return ids
+
+
+def test_cursor_keeps_microseconds(anon_client, recipes):
+    # Даты публикации различаются меньше чем на миллисекунду.
+    now = timezone.now().replace(microsecond=1000)
+    for number, recipe in enumerate(recipes):
+        Recipe.objects.filter(pk=recipe.pk).update(
+            pub_date=now + datetime.timedelta(microseconds=number % 7))
+    expected = list(Recipe.objects.order_by(
+        '-pub_date', '-id').values_list('id', flat=True))
+    assert collect_pages(
+        anon_client, '/api/recipes/?limit=3&cursor=') == expected
+
+
+@pytest.mark.skipif(connection.vendor != 'postgresql',
+                    reason='SearchRank есть только в PostgreSQL')
+def test_search_cursor_with_tied_ranks(anon_client, recipes):
+    # У всех рецептов одинаковый ранг: страницы разделяет сравнение
+    # ранга из курсора на равенство.
+    Recipe.objects.update_search_vector()
+    url = f'/api/recipes/?search={quote("рецепт")}'
+    expected = [recipe['id'] for recipe in
+                anon_client.get(f'{url}&limit=100').data['results']]
+    assert len(expected) == len(recipes)
+    assert collect_pages(anon_client, f'{url}&limit=3&cursor=') == expected
@@ -0,0 +1,54 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from users.models import Subscribe
+
+pytestmark = pytest.mark.django_db
+
+# Число запросов не зависит от размера страницы и от пользователя:
+# COUNT, страница рецептов (с отметками пользователя), теги, ингредиенты.
+RECIPE_LIST_QUERIES = 4
+# COUNT и страница пользователей с отметкой подписки.
+USER_LIST_QUERIES = 2
+
+
+def count_queries(client, url):
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+    assert response.status_code == 200, response.content
+    return len(context), response.json()
+
+
+@pytest.mark.parametrize('client_fixture', ['anon_client', 'user_client'])
+@pytest.mark.parametrize('limit', [2, 12])
+def test_recipe_list_queries(request, recipes, client_fixture, limit):
+    client = request.getfixturevalue(client_fixture)
+    queries, data = count_queries(client, f'/api/recipes/?limit={limit}')
+    assert len(data['results']) == limit
+    assert queries == RECIPE_LIST_QUERIES
+
+
+def test_recipe_list_user_flags(user_client, recipes):
+    _, data = count_queries(user_client, '/api/recipes/?limit=20')
+    favorited = {recipe['id'] for recipe in data['results']
+                 if recipe['is_favorited']}
+    in_cart = {recipe['id'] for recipe in data['results']
+               if recipe['is_in_shopping_cart']}
+    expected = {recipe.id for recipe in recipes[::3]}
+    assert favorited == in_cart == expected
+
+
+@pytest.mark.parametrize('client_fixture', ['anon_client', 'user_client'])
+@pytest.mark.parametrize('limit', [1, 10])
+def test_user_list_queries(request, django_user_model, user, author,
+                           client_fixture, limit):
+    django_user_model.objects.bulk_create(
+        [django_user_model(username=f'user{number}',
+                           email=f'user{number}@example.com')
+         for number in range(15)])
+    Subscribe.objects.create(user=user, author=author)
+    client = request.getfixturevalue(client_fixture)
+    queries, data = count_queries(client, f'/api/users/?limit={limit}')
+    assert len(data['results']) == limit
+    assert queries == USER_LIST_QUERIES
@@ -0,0 +1,83 @@
+import io
+
+import pytest
+from django.core.management import call_command
+
+from recipes.images import (SyncImageQueue, ThreadPoolImageQueue,
+                            image_queue, process_recipe_image)
+from recipes.models import Recipe
+
+pytestmark = pytest.mark.django_db
+
+IMAGE_URL = 'http://testserver/media/recipes/media/test.jpg'
+
+
+def recipe_data(tags, ingredients):
+    return {
+        'name': 'Рецепт',
+        'text': 'Описание',
+        'cooking_time': 10,
+        'image': IMAGE_URL,
+        'tags': [tags[0].id],
+        'ingredients': [{'id': ingredients[0].id, 'amount': 10}],
+    }
+
+
+def test_create_with_image_url(user_client, tags, ingredients):
+    response = user_client.post(
+        '/api/recipes/', recipe_data(tags, ingredients), format='json')
+    assert response.status_code == 400
+    assert 'image' in response.data
+
+
+def test_update_with_image_url(user_client, recipes, user, tags,
+                               ingredients):
+    # Адрес текущего изображения при изменении оставляет его прежним.
+    recipe = next(recipe for recipe in recipes if recipe.author == user)
+    response = user_client.patch(
+        f'/api/recipes/{recipe.id}/', recipe_data(tags, ingredients),
+        format='json')
+    assert response.status_code == 200, response.data
+    recipe.refresh_from_db()
+    assert recipe.image.name == 'recipes/media/test.jpg'
+
+
+def test_image_queue_follows_settings(settings):
+    # Очередь уже создана до второго изменения настройки.
+    settings.IMAGE_QUEUE = 'recipes.images.ThreadPoolImageQueue'
+    assert isinstance(image_queue, ThreadPoolImageQueue)
+    settings.IMAGE_QUEUE = 'recipes.images.SyncImageQueue'
+    assert isinstance(image_queue, SyncImageQueue)
+
+
+@pytest.mark.parametrize('url, variant', (
+    ('/api/recipes/', 'card'),
+    ('/api/recipes/what_to_cook/?ingredients={ingredients}', 'card'),
+    ('/api/recipes/{recipe}/', 'full'),
+))
+def test_image_variant_by_action(user_client, recipes, url, variant):
+    recipe = recipes[-1]
+    Recipe.objects.filter(pk=recipe.pk).update(image_variants={
+        'source': recipe.image.name,
+        'card': {'webp': 'recipes/variants/card.webp'},
+        'full': {'webp': 'recipes/variants/full.webp'},
+    })
+    ingredients = ','.join(str(pk) for pk in recipe.recipes.values_list(
+        'ingredient_id', flat=True))
+    response = user_client.get(
+        url.format(recipe=recipe.id, ingredients=ingredients))
+    data = response.data.get('results', [response.data])
+    [card] = [item for item in data if item['id'] == recipe.id]
+    assert card['image'].endswith(f'/{variant}.webp')
+
+
+def test_failed_image_retried(recipes):
+    # Файла изображения нет: обработка завершается ошибкой.
+    recipe = recipes[0]
+    process_recipe_image(recipe.id, recipe.image.name)
+    recipe.refresh_from_db()
+    assert recipe.image_variants == {
+        'source': recipe.image.name, 'failed': True}
+    out = io.StringIO()
+    call_command('process_recipe_images', stdout=out)
+    assert f'Обработано изображений: {len(recipes)}' in out.getvalue()
@@ -0,0 +1,72 @@
+import pytest
+from django.core.management import call_command
+from django.db import connection
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def recipe(recipes, user):
+    return next(recipe for recipe in recipes if recipe.author == user)
+
+
+def ingredient_rows(recipe):
+    return [{'id': item.ingredient_id, 'amount': item.amount}
+            for item in recipe.recipes.order_by('id')]
+
+
+def row_versions(recipe):
+    """Физические адреса строк ингредиентов: UPDATE создаёт новую версию
+    строки с другим адресом."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT ingredient_id, ctid::text '
+            'FROM recipes_ingredientinrecipe WHERE recipe_id = %s',
+            [recipe.id])
+        return dict(cursor.fetchall())
+
+
+def patch(client, recipe, data):
+    """id ингредиентов, строки которых были перезаписаны."""
+    before = row_versions(recipe)
+    response = client.patch(
+        f'/api/recipes/{recipe.id}/', data, format='json')
+    assert response.status_code == 200, response.data
+    call_command('recount_recipes', '--verify')
+    after = row_versions(recipe)
+    return {ingredient_id for ingredient_id, version in before.items()
+            if after.get(ingredient_id, version) != version}
+
+
+@pytest.mark.skipif(connection.vendor != 'postgresql',
+                    reason='ctid есть только в PostgreSQL')
+def test_same_count_keeps_rows(user_client, recipe):
+    # Изменилось только количество: остальные строки не перезаписываются.
+    rows = ingredient_rows(recipe)
+    rows[0]['amount'] += 1
+    rewritten = patch(user_client, recipe, {
+        'ingredients': rows, 'cooking_time': recipe.cooking_time})
+    assert rewritten == {rows[0]['id']}
+
+
+@pytest.mark.parametrize('change', ('add', 'remove', 'cooking_time'))
+def test_changed_fields_copied(user_client, recipe, ingredients, change):
+    # recount_recipes --verify в patch проверяет копии полей рецепта.
+    rows = ingredient_rows(recipe)
+    data = {'ingredients': rows}
+    if change == 'add':
+        rows.append({'id': ingredients[-1].id, 'amount': 5})
+    elif change == 'remove':
+        rows.pop()
+    else:
+        data = {'cooking_time': recipe.cooking_time % 60 + 2}
+    patch(user_client, recipe, data)
+
+
+def test_ingredient_delete(recipe, ingredients):
+    # Каскадное удаление строк рецепта изменяет число его ингредиентов.
+    ingredient = recipe.recipes.first().ingredient
+    ingredient.delete()
+    call_command('recount_recipes', '--verify')
+    assert set(recipe.recipes.values_list('ingredients_count', flat=True)) == {
+        recipe.recipes.count()}
@@ -0,0 +1,19 @@
+import pytest
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.mark.parametrize('url', ('/api/ingredients/', '/api/tags/'))
+def test_cached_list_varies_by_accept(anon_client, ingredients, tags, url):
+    # Второй запрос берёт готовый json из кеша ответов.
+    for _ in range(2):
+        response = anon_client.get(url)
+        assert response['Content-Type'] == 'application/json'
+        assert 'Accept' in response['Vary']
+    html = anon_client.get(url, HTTP_ACCEPT='text/html')
+    assert html['Content-Type'].startswith('text/html')
+    assert 'Accept' in html['Vary']
+    assert html['ETag'] != response['ETag']
+    response = anon_client.get(
+        url, HTTP_ACCEPT='text/html', HTTP_IF_NONE_MATCH=response['ETag'])
+    assert response.status_code == 200
@@ -0,0 +1,31 @@
+import pytest
+
+from api.serializers import RecipeCreateUpdateSerializer
+from users.models import Subscribe
+
+pytestmark = pytest.mark.django_db
+
+RECIPE_FIELDS = {
+    'id', 'author', 'image', 'image_variants', 'tags', 'ingredients',
+    'is_favorited', 'is_in_shopping_cart', 'name', 'text', 'cooking_time',
+}
+
+
+@pytest.mark.parametrize('url', (
+    '/api/recipes/', '/api/recipes/?cursor=', '/api/recipes/feed/'))
+def test_recipe_list_fields(user_client, recipes, user, author, url):
+    # Служебные поля (счётчики, search_vector) не попадают в ответ.
+    Subscribe.objects.create(user=user, author=author)
+    response = user_client.get(url)
+    assert set(response.data['results'][0]) == RECIPE_FIELDS
+
+
+def test_recipe_detail_fields(user_client, recipes):
+    response = user_client.get(f'/api/recipes/{recipes[0].id}/')
+    assert set(response.data) == RECIPE_FIELDS
+
+
+def test_recipe_create_fields():
+    assert set(RecipeCreateUpdateSerializer().fields) == {
+        'id', 'author', 'image', 'ingredients', 'tags', 'name', 'text',
+        'cooking_time'}
@@ -0,0 +1,123 @@
+import pytest
+from django.core.management import call_command
+
+from recipes.models import Recipe, ShoppingCart
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def carts(recipes, user, author):
+    """Рецепты в корзинах обоих пользователей."""
+    for recipe in recipes[:4]:
+        ShoppingCart.objects.get_or_create(user=user, recipe=recipe)
+        ShoppingCart.objects.get_or_create(user=author, recipe=recipe)
+    return recipes[:4]
+
+
+def assert_shopping_lists_match_carts():
+    call_command('rebuild_shopping_lists', '--verify')
+
+
+def recipe_form(recipe, ingredient_rows):
+    """Данные формы рецепта в админке со строками ингредиентов."""
+    data = {
+        'name': recipe.name,
+        'author': recipe.author_id,
+        'tags': list(recipe.tags.values_list('id', flat=True)),
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'recipes-TOTAL_FORMS': len(ingredient_rows),
+        'recipes-INITIAL_FORMS': recipe.recipes.count(),
+        'recipes-MIN_NUM_FORMS': 0,
+        'recipes-MAX_NUM_FORMS': 1000,
+    }
+    for number, row in enumerate(ingredient_rows):
+        for field, value in row.items():
+            data[f'recipes-{number}-{field}'] = value
+        data[f'recipes-{number}-recipe'] = recipe.id
+    return data
+
+
+def test_api_recipe_delete(carts, user_client, user):
+    recipe = next(recipe for recipe in carts if recipe.author == user)
+    response = user_client.delete(f'/api/recipes/{recipe.id}/')
+    assert response.status_code == 204
+    assert_shopping_lists_match_carts()
+
+
+def test_admin_recipe_delete(admin_client, carts):
+    response = admin_client.post(
+        f'/admin/recipes/recipe/{carts[0].id}/delete/', {'post': 'yes'})
+    assert response.status_code == 302
+    assert not Recipe.objects.filter(pk=carts[0].id).exists()
+    assert_shopping_lists_match_carts()
+
+
+def test_admin_recipe_bulk_delete(admin_client, carts):
+    response = admin_client.post('/admin/recipes/recipe/', {
+        'action': 'delete_selected',
+        '_selected_action': [recipe.id for recipe in carts[:2]],
+        'post': 'yes',
+    })
+    assert response.status_code == 302
+    assert not Recipe.objects.filter(pk__in=[carts[0].id, carts[1].id])
+    assert_shopping_lists_match_carts()
+
+
+def test_user_delete(user, carts):
+    # Удаляются корзины пользователя и его рецепты в корзинах других.
+    user.delete()
+    assert_shopping_lists_match_carts()
+
+
+def test_admin_ingredient_inline(admin_client, carts, ingredients):
+    recipe = carts[0]
+    items = list(recipe.recipes.order_by('id'))
+    rows = [
+        {'id': items[0].id, 'ingredient': items[0].ingredient_id,
+         'amount': items[0].amount + 7},
+        {'id': items[1].id, 'ingredient': items[1].ingredient_id,
+         'amount': items[1].amount, 'DELETE': 'on'},
+        {'id': items[2].id, 'ingredient': items[2].ingredient_id,
+         'amount': items[2].amount},
+        {'id': '', 'ingredient': ingredients[-1].id, 'amount': 5},
+    ]
+    response = admin_client.post(
+        f'/admin/recipes/recipe/{recipe.id}/change/',
+        recipe_form(recipe, rows))
+    assert response.status_code == 302, response.content.decode()[:3000]
+    assert set(recipe.recipes.values_list('ingredient_id', flat=True)) == {
+        items[0].ingredient_id, items[2].ingredient_id, ingredients[-1].id}
+    assert_shopping_lists_match_carts()
+    call_command('recount_recipes', '--verify')
+
+
+def test_admin_cart_change_and_delete(admin_client, carts, recipes, author):
+    cart = ShoppingCart.objects.filter(user=author).first()
+    response = admin_client.post(
+        f'/admin/recipes/shoppingcart/{cart.id}/change/',
+        {'user': author.id, 'recipe': recipes[10].id})
+    assert response.status_code == 302
+    assert_shopping_lists_match_carts()
+    response = admin_client.post(
+        f'/admin/recipes/shoppingcart/{cart.id}/delete/', {'post': 'yes'})
+    assert response.status_code == 302
+    assert not ShoppingCart.objects.filter(pk=cart.id).exists()
+    assert_shopping_lists_match_carts()
+
+
+def test_orm_cart_create_change_delete(recipes, author):
+    # Без пересчёта между изменениями: списки меняют только сигналы.
+    cart = ShoppingCart.objects.create(user=author, recipe=recipes[1])
+    assert_shopping_lists_match_carts()
+    cart.recipe = recipes[2]
+    cart.save()
+    assert_shopping_lists_match_carts()
+    cart.delete()
+    assert_shopping_lists_match_carts()
+
+
+def test_orm_cart_delete(carts, user):
+    ShoppingCart.objects.filter(user=user).delete()
+    assert_shopping_lists_match_carts()
@@ -0,0 +1,37 @@
+import pytest
+from django.core.cache import cache
+from django.utils.http import http_date
+
+from recipes.models import TableVersion, Tag
+
+pytestmark = pytest.mark.django_db
+
+
+def test_etag_does_not_depend_on_cache(anon_client, tags):
+    first = anon_client.get('/api/tags/')
+    # Новый процесс или истёкшая запись кеша.
+    cache.clear()
+    second = anon_client.get('/api/tags/')
+    assert first['ETag'] == second['ETag']
+    assert first['Last-Modified'] == second['Last-Modified']
+    response = anon_client.get(
+        '/api/tags/', HTTP_IF_NONE_MATCH=first['ETag'])
+    assert response.status_code == 304
+
+
+def test_last_modified_is_change_time(anon_client, tags):
+    modified = TableVersion.objects.get(table='recipes.tag').modified
+    response = anon_client.get('/api/tags/')
+    assert response['Last-Modified'] == http_date(modified.timestamp())
+
+
+def test_change_bumps_version(anon_client, tags,
+                              django_capture_on_commit_callbacks):
+    first = anon_client.get('/api/tags/')
+    with django_capture_on_commit_callbacks(execute=True):
+        Tag.objects.create(name='Новый', slug='new', color='#FFFFFF')
+    response = anon_client.get(
+        '/api/tags/', HTTP_IF_NONE_MATCH=first['ETag'])
+    assert response.status_code == 200
+    assert response['ETag'] != first['ETag']
+    assert 'new' in [tag['slug'] for tag in response.json()]
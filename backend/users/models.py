@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import connections, models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.db.models import Q, F
 
@@ -20,6 +20,97 @@ class User(AbstractUser):
         return self.username
 
 
+class LinkQuerySet(models.QuerySet):
+    """Связи пользователя с объектами: подписки, избранное, корзина.
+
+    Связь добавляется запросом INSERT ... ON CONFLICT DO NOTHING и
+    удаляется запросом DELETE без предварительных проверок, поэтому
+    одновременные запросы не приводят к ошибкам целостности. Методы
+    возвращают id объектов, для которых связь действительно изменилась:
+    в PostgreSQL — через RETURNING одним запросом, в остальных базах по
+    числу изменённых строк отдельным запросом на каждый объект.
+    """
+    target_field = None
+
+    def get_related_sql(self, delta):
+        """Запрос PostgreSQL, выполняемый вместе с изменением связей.
+
+        Изменённые id доступны в нём как SELECT target_id FROM changed.
+        """
+        return None
+
+    def update_related(self, target_ids, delta):
+        """То же, что get_related_sql, для остальных баз данных."""
+
+    def add(self, user, target_ids):
+        """Добавление связей с существующими объектами."""
+        ops = connections[self.db].ops
+        target = self.model._meta.get_field(self.target_field)
+        target_table = ops.quote_name(target.related_model._meta.db_table)
+        target_pk = ops.quote_name(target.target_field.column)
+        return self._change(
+            f'{ops.insert_statement(ignore_conflicts=True)} '
+            f'{self._table} ({self._user_column}, {self._target_column}) '
+            f'SELECT %s, {target_pk} FROM {target_table} '
+            f'WHERE {target_pk} IN ({{placeholders}}) '
+            f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}',
+            user, target_ids, 1
+        )
+
+    def remove(self, user, target_ids):
+        """Удаление связей."""
+        return self._change(
+            f'DELETE FROM {self._table} WHERE {self._user_column} = %s '
+            f'AND {self._target_column} IN ({{placeholders}})',
+            user, target_ids, -1
+        )
+
+    @property
+    def _table(self):
+        return connections[self.db].ops.quote_name(self.model._meta.db_table)
+
+    @property
+    def _user_column(self):
+        return connections[self.db].ops.quote_name(
+            self.model._meta.get_field('user').column)
+
+    @property
+    def _target_column(self):
+        return connections[self.db].ops.quote_name(
+            self.model._meta.get_field(self.target_field).column)
+
+    def _change(self, statement, user, target_ids, delta):
+        target_ids = list(target_ids)
+        if not target_ids:
+            return []
+        connection = connections[self.db]
+        if connection.vendor == 'postgresql':
+            sql = statement.format(
+                placeholders=', '.join(['%s'] * len(target_ids)))
+            sql = f'{sql} RETURNING {self._target_column} AS target_id'
+            related = self.get_related_sql(delta)
+            if related:
+                sql = (f'WITH changed AS ({sql}), related AS ({related}) '
+                       f'SELECT target_id FROM changed')
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [user.pk, *target_ids])
+                return [row[0] for row in cursor.fetchall()]
+        with transaction.atomic(using=self.db), connection.cursor() as cursor:
+            changed = []
+            sql = statement.format(placeholders='%s')
+            for target_id in target_ids:
+                cursor.execute(sql, [user.pk, target_id])
+                if cursor.rowcount > 0:
+                    changed.append(target_id)
+            if changed:
+                self.update_related(changed, delta)
+        return changed
+
+
+class SubscribeQuerySet(LinkQuerySet):
+    target_field = 'author'
+
+
 class Subscribe(models.Model):
     """Модель создания и редактирования подписок на авторов."""
     user = models.ForeignKey(
@@ -33,6 +124,8 @@ class Subscribe(models.Model):
         related_name='following',
     )
 
+    objects = SubscribeQuerySet.as_manager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(